@@ -0,0 +1,264 @@
+from datetime import datetime
+from typing import Any, Dict, List
+
+import numpy as np
+
+# Deterministic versions of the thresholds the pest prompt used to hand to the LLM.
+# Everything works on (days, samples) arrays, so a 7-day check is a handful of
+# vectorized comparisons instead of an LLM round trip.
+
+ALERT_LEVELS = ["none", "low", "medium", "high"]
+
+
+def longest_streak(mask: np.ndarray) -> int:
+    """Length of the longest run of consecutive True values"""
+    if not mask.any():
+        return 0
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return int((np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)).max())
+
+
+#--------------------------------------------PEST RISK-----------------------------------------------------------------------------------------
+
+def pest_features_from_wwo(weather_data: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    """
+    WorldWeatherOnline past-weather response -> daily and (days, samples) arrays.
+    WWO reports 3-hourly samples by default, so counts are converted to hours.
+    """
+    days = weather_data["data"]["weather"]
+    samples = min(len(day["hourly"]) for day in days)
+
+    def hourly(key: str, fallback: str = None) -> np.ndarray:
+        return np.array([
+            [float(h.get(key, day[fallback]) if fallback else h[key]) for h in day["hourly"][:samples]]
+            for day in days
+        ], dtype=float)
+
+    return {
+        "dates": np.array([day["date"] for day in days]),
+        "max_temp": np.array([float(day["maxtempC"]) for day in days]),
+        "min_temp": np.array([float(day["mintempC"]) for day in days]),
+        "avg_temp": np.array([float(day["avgtempC"]) for day in days]),
+        "temp": hourly("tempC", fallback="avgtempC"),
+        "humidity": hourly("humidity"),
+        "precip": hourly("precipMM"),
+        "wind": hourly("windspeedKmph"),
+        "hours_per_sample": np.float64(24 / samples) if samples else np.float64(1)
+    }
+
+
+def evaluate_pest_risk(f: Dict[str, np.ndarray]) -> Dict[str, Any]:
+    """
+    Applies the pest risk rules to the arrays of pest_features_from_wwo.
+    Returns {"pest_alert_level": "none|low|medium|high", "primary_risk_factors": [...]}
+    """
+    hps = f["hours_per_sample"]
+    avg_temp = f["avg_temp"]
+    total_precip = f["precip"].sum(axis=1)
+    avg_humidity = f["humidity"].mean(axis=1)
+    max_wind = f["wind"].max(axis=1)
+    rain_hours = (f["precip"] > 0).sum(axis=1) * hps
+    humid_hours = (f["humidity"] > 70).sum(axis=1) * hps
+    very_humid_hours = (f["humidity"] > 80).sum(axis=1) * hps
+    warm_rain_hours = ((f["precip"] > 0) & (f["temp"] > 25)).sum(axis=1) * hps
+
+    optimal_temp = (avg_temp >= 20) & (avg_temp <= 30)
+    humid_days = avg_humidity > 70
+    rainy_days = total_precip > 0
+    wet_days = total_precip > 5
+    windy_days = max_wind > 15
+
+    high, medium, low = [], [], []
+
+    # Immediate alert triggers
+    if (triggered := (rain_hours > 8) & (avg_temp > 25)).any():
+        high.append(f"{int(triggered.sum())} day(s) with >8 rainy hours above 25°C")
+    if (triggered := avg_humidity > 85).sum() >= 2:
+        high.append(f"{int(triggered.sum())} days with humidity >85%")
+    if (triggered := (total_precip > 10) & (avg_temp > 22)).any():
+        high.append(f"{int(triggered.sum())} day(s) with >10mm rain above 22°C")
+
+    # Moderate alert triggers
+    if (triggered := humid_hours >= 4).sum() >= 3:
+        medium.append(f"{int(triggered.sum())} days with 4+ high-humidity hours")
+    if ((avg_temp >= 24) & (avg_temp <= 28)).all() and rainy_days.any() and not rainy_days.all():
+        medium.append("steady 24-28°C with intermittent rain")
+    if (streak := longest_streak(optimal_temp & humid_days)) >= 3:
+        medium.append(f"{streak} consecutive warm (20-30°C) days with humidity >70%")
+    if (streak := longest_streak(optimal_temp & (total_precip > 2))) >= 3:
+        medium.append(f"{streak} consecutive warm (20-30°C) days with rain >2mm")
+
+    # Contributing factors
+    if (streak := longest_streak(optimal_temp)) >= 2:
+        low.append(f"{streak} consecutive days at 20-30°C")
+    if ((f["max_temp"] - f["min_temp"]) > 5).any():
+        low.append("daily temperature swings >5°C")
+    if humid_days.any():
+        low.append(f"{int(humid_days.sum())} day(s) with average humidity >70%")
+    if (very_humid_hours > 0).any():
+        low.append(f"{int(very_humid_hours.sum())} hours with humidity >80%")
+    if (streak := longest_streak(humid_days)) >= 2:
+        low.append(f"{streak} consecutive high-humidity days")
+    if wet_days.any():
+        low.append(f"{int(wet_days.sum())} day(s) with >5mm rain")
+    if (streak := longest_streak(rainy_days)) > 3:
+        low.append(f"{streak} consecutive rainy days")
+    if (warm_rain_hours > 0).any():
+        low.append(f"{int(warm_rain_hours.sum())} rainy hours above 25°C")
+    if windy_days.any():
+        low.append(f"{int(windy_days.sum())} day(s) with wind >15km/h")
+    if (windy_days[1:] & rainy_days[:-1]).any():
+        low.append("windy days following rain")
+    if len(avg_humidity) >= 3 and avg_humidity[-1] > avg_humidity[-2] > avg_humidity[-3]:
+        low.append("humidity rising over the last 48 hours")
+
+    if high:
+        level = "high"
+    elif medium:
+        level = "medium"
+    elif len(low) >= 3:
+        level = "low"
+    else:
+        level = "none"
+
+    factors = high + medium + low
+    return {
+        "pest_alert_level": level,
+        "primary_risk_factors": factors[:5] if level != "none" else []
+    }
+
+
+DEFAULT_PEST_ACTIONS: Dict[str, List[str]] = {
+    "low": ["Scout fields twice a week for early signs of pests and disease"],
+    "medium": [
+        "Scout fields every 2-3 days, especially leaf undersides",
+        "Improve drainage and airflow to reduce leaf wetness"
+    ],
+    "high": [
+        "Inspect crops daily and remove infected plant parts",
+        "Apply a recommended preventive fungicide/insecticide on a dry morning",
+        "Avoid overhead irrigation until conditions improve"
+    ]
+}
+
+
+#--------------------------------------------WEATHER RISK--------------------------------------------------------------------------------------
+
+def streak_starts(mask: np.ndarray, min_length: int) -> np.ndarray:
+    """Start indices of runs of at least min_length consecutive True values"""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    return starts[(ends - starts) >= min_length]
+
+
+def weather_features_from_forecast(res: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    """weatherapi.com forecast.json response -> hourly arrays, starting at the current local hour"""
+    hours = [hour for day in res.get('forecast', {}).get('forecastday', []) for hour in day.get('hour', [])]
+
+    def series(key: str) -> np.ndarray:
+        return np.array([float(hour.get(key) or 0) for hour in hours], dtype=float)
+
+    times = np.array([hour.get('time', '') for hour in hours])
+    localtime = res.get('location', {}).get('localtime', '')
+    start = 0
+    if localtime:
+        try:
+            now = datetime.strptime(localtime, "%Y-%m-%d %H:%M").strftime("%Y-%m-%d %H:00")
+            start = int(np.searchsorted(times, now))
+        except ValueError:
+            start = 0
+
+    return {
+        "times": times[start:],
+        "precip": series('precip_mm')[start:],
+        "wind": series('wind_kph')[start:],
+        "gust": series('gust_kph')[start:],
+        "temp": series('temp_c')[start:],
+        "humidity": series('humidity')[start:],
+        "heat_index": series('heatindex_c')[start:],
+        "official_alerts": [alert.get('headline', '') for alert in res.get('alerts', {}).get('alert', [])]
+    }
+
+
+# Action for each risk of the weather thresholds below
+WEATHER_ACTIONS = {
+    "flood": "Clear field drains and channels, move harvested produce and inputs to higher ground",
+    "inundation": "Open drainage outlets and avoid irrigation, keep fertilizer application on hold",
+    "saturated_soil": "Keep machinery off wet fields and postpone irrigation",
+    "lodging": "Stake or earth up tall crops and delay spraying until winds drop",
+    "wind_damage": "Secure polyhouses, nets and stored produce, harvest mature produce early",
+    "heat_stress": "Irrigate in the early morning or evening and mulch to keep soil moisture",
+    "frost": "Give light irrigation in the evening and cover sensitive crops overnight",
+    "fungal": "Check crops for fungal spots and plan a preventive fungicide spray in a dry spell",
+    "desiccation": "Irrigate lightly and use windbreaks or mulch to limit moisture loss",
+    "erosion": "Keep soil covered and reinforce field bunds on slopes",
+    "heat_index": "Avoid field work between 11:00 and 16:00 and keep livestock shaded with water"
+}
+
+
+def evaluate_weather_risk(f: Dict[str, np.ndarray]) -> Dict[str, Any]:
+    """
+    Applies the weather alert thresholds to the hourly arrays of weather_features_from_forecast.
+    Hour 0 is the current local hour. Risks in the next 24h set the level, risks only
+    in the 24-48h range make it low.
+    Returns {"weather_alert_level", "immediate_risks", "time_bound_actions"}
+    """
+    times, precip, wind = f["times"], f["precip"], f["wind"]
+    hits = []   # (first hour ahead, severity, key, description)
+
+    def check(mask: np.ndarray, severity: str, key: str, description: str, offset: int = 0):
+        idx = np.flatnonzero(mask)
+        if idx.size:
+            first = int(idx[0]) + offset
+            at = times[first][-5:] if first < len(times) else ""
+            hits.append((first, severity, key, f"{description} from {at}"))
+
+    if len(times):
+        # 1. Heavy rain
+        check(precip > 10, "high", "flood", "Heavy rain >10mm/h (flood risk)")
+        if len(precip) >= 3:
+            check(np.convolve(precip, np.ones(3), "valid") > 20, "high", "inundation", "Rain >20mm in 3h (field inundation)")
+        days = np.array([t[:10] for t in times])
+        for day in np.unique(days):
+            in_day = days == day
+            if ((precip > 0) & in_day).sum() > 8:
+                check((precip > 0) & in_day, "medium", "saturated_soil", f">8 rainy hours on {day} (saturated soil)")
+        # 2. Wind damage
+        check(wind > 30, "medium", "lodging", "Sustained wind >30km/h (crop lodging)")
+        check(f["gust"] > 45, "high", "wind_damage", "Gusts >45km/h (physical damage)")
+        # 3. Temperature extremes
+        check(f["temp"] > 40, "high", "heat_stress", "Temperature >40°C (heat stress)")
+        check(f["temp"] < 5, "medium", "frost", "Temperature <5°C (frost risk)")
+        # 4. Humidity risks
+        starts = streak_starts(f["humidity"] > 90, 6)
+        if starts.size:
+            hits.append((int(starts[0]), "medium", "fungal", f"Humidity >90% for 6+ hours (fungal risk) from {times[starts[0]][-5:]}"))
+        check((f["humidity"] < 30) & (wind > 30), "medium", "desiccation", "Humidity <30% with high winds (desiccation)")
+        # 5. Compound risks
+        check((precip > 0) & (wind > 30), "medium", "erosion", "Rain with wind >30km/h (erosion)")
+        check(f["heat_index"] > 45, "high", "heat_index", "Heat index >45°C")
+
+    official = [alert for alert in f["official_alerts"] if alert]
+    if not hits and not official:
+        return {"weather_alert_level": "none", "immediate_risks": [], "time_bound_actions": []}
+
+    hits.sort(key=lambda hit: (hit[0] >= 24, hit[0] >= 12, hit[1] != "high", hit[0]))
+    near = [hit for hit in hits if hit[0] < 24]
+    if any(hit[1] == "high" for hit in near):
+        level = "high"
+    elif near or official:
+        level = "medium"
+    else:
+        level = "low"
+
+    actions, seen = [], set()
+    for first, _, key, _ in hits:
+        if key not in seen and first < 24:
+            seen.add(key)
+            actions.append({"time_window": "0-6h" if first < 6 else "6-24h", "action": WEATHER_ACTIONS[key]})
+
+    return {
+        "weather_alert_level": level,
+        "immediate_risks": (official + [hit[3] for hit in hits])[:3],
+        "time_bound_actions": actions
+    }
@@ -0,0 +1,81 @@
+import asyncio
+from typing import Any
+
+import mongomock
+
+# Async adapter over mongomock with the small part of the PyMongo async API database.py
+# uses, for benchmarking without a Mongo server. Every call yields to the event loop once
+# (plus an optional simulated round trip), like a real driver call would.
+
+COLLECTIONS = {
+    "farmers": "Info",
+    "market_snapshots": "MarketSnapshots",
+    "llm_cache_collection": "LLMCache",
+    "scheduled_runs": "ScheduledRuns",
+    "scheduled_jobs": "ScheduledJobs"
+}
+
+
+def compatible_pipeline(value: Any) -> Any:
+    """mongomock evaluates {"$not": [expr]} as not [expr] (always False), rewritten as {"$eq": [expr, False]}"""
+    if isinstance(value, list):
+        return [compatible_pipeline(item) for item in value]
+    if isinstance(value, dict):
+        if set(value) == {"$not"} and isinstance(value["$not"], list) and len(value["$not"]) == 1:
+            return {"$eq": [compatible_pipeline(value["$not"][0]), False]}
+        return {key: compatible_pipeline(item) for key, item in value.items()}
+    return value
+
+
+class AsyncCursor:
+    def __init__(self, cursor, latency: float):
+        self.cursor = cursor
+        self.latency = latency
+
+    def sort(self, *args, **kwargs) -> "AsyncCursor":
+        self.cursor = self.cursor.sort(*args, **kwargs)
+        return self
+
+    def limit(self, count: int) -> "AsyncCursor":
+        self.cursor = self.cursor.limit(count)
+        return self
+
+    async def to_list(self, length=None):
+        await asyncio.sleep(self.latency)
+        return list(self.cursor)
+
+    async def __aiter__(self):
+        await asyncio.sleep(self.latency)
+        for document in self.cursor:
+            yield document
+
+
+class AsyncCollection:
+    def __init__(self, collection, latency: float):
+        self.collection = collection
+        self.latency = latency
+
+    def find(self, *args, batch_size: Any = None, **kwargs) -> AsyncCursor:
+        return AsyncCursor(self.collection.find(*args, **kwargs), self.latency)
+
+    async def find_one_and_update(self, query, update, **kwargs):
+        await asyncio.sleep(self.latency)
+        if isinstance(update, list):
+            update = compatible_pipeline(update)
+        return self.collection.find_one_and_update(query, update, **kwargs)
+
+    def __getattr__(self, name: str):
+        method = getattr(self.collection, name)
+
+        async def call(*args, **kwargs):
+            await asyncio.sleep(self.latency)
+            return method(*args, **kwargs)
+        return call
+
+
+def use_mongomock(database, latency_ms: float = 0.0):
+    """Points the collections of the database module at an in-memory mongomock database"""
+    db = mongomock.MongoClient()[database.MONGODB_DATABASE]
+    for attribute, collection in COLLECTIONS.items():
+        setattr(database, attribute, AsyncCollection(db[collection], latency_ms / 1000))
+    return db
@@ -0,0 +1,263 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+import httpx
+import numpy as np
+
+from bench import stubs
+
+# Benchmark of the backend against local stub upstreams (bench/stubs.py, started as a
+# subprocess) and mongomock, or a local Mongo with --mongo-uri. The app runs in this
+# process behind an in-memory ASGI transport:
+#
+#   webhook    N concurrent users each send R messages to /mockup-webhook
+#   scheduled  /mockup-scheduled-run over M synthetic farmers, --runs times
+#
+# Reports p50/p95/p99 latency, requests/sec and upstream calls per request, e.g.
+#
+#   cd backend && python -m bench.run_bench --users 50 --requests 4 --farmers 2000 --llm-ms 900
+
+CITIES = [
+    ("Karnal", "HARYANA"), ("Ludhiana", "PUNJAB"), ("Nashik", "MAHARASHTRA"), ("Indore", "MADHYA PRADESH"),
+    ("Guntur", "ANDHRA PRADESH"), ("Cuttack", "ODISHA"), ("Hooghly", "WEST BENGAL"), ("Jaipur", "RAJASTHAN"),
+    ("Rajkot", "GUJARAT"), ("Mysuru", "KARNATAKA"), ("Patna", "BIHAR"), ("Agra", "UTTAR PRADESH")
+]
+FARMER_COMMODITIES = [["Wheat", "Mustard"], ["Paddy"], ["Onion", "Tomato"], ["Soyabean", "Maize"], ["Cotton"], ["Potato", "Garlic"]]
+MESSAGES = [
+    "What should I do for my crops this week?",
+    "hello",
+    "add onion",
+    "Will it rain tomorrow, should I irrigate my field?"
+]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_stubs(args) -> subprocess.Popen:
+    process = subprocess.Popen(
+        [sys.executable, "-m", "bench.stubs", "--port", str(args.stub_port)] + stubs.latency_arguments(args),
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{args.stub_port}/_stats", timeout=1).raise_for_status()
+            return process
+        except httpx.HTTPError:
+            if process.poll() is not None:
+                raise RuntimeError("Stub server exited during startup")
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Stub server did not start")
+
+def configure_environment(args):
+    """Upstream URLs, dummy keys and Mongo settings, set before main is imported"""
+    base = f"http://127.0.0.1:{args.stub_port}"
+    os.environ.update({
+        "WEATHER_API_URL": f"{base}/weatherapi/v1/forecast.json",
+        "WWO_API_URL": f"{base}/wwo/premium/v1/past-weather.ashx",
+        "ENAM_URL": f"{base}/enam/commodity_list",
+        "NVIDIA_INVOKE_URL": f"{base}/nvidia/v1/chat/completions",
+        "TRANSLATE_URL": f"{base}/translate",
+        # real keys from .env never leave the machine
+        "WEATHER_API_KEY": "bench", "WORLD_WEATHER_ONLINE_API": "bench", "NVIDIA_API_KEY": "bench",
+        "MONGODB_CONNECTION_STRING": args.mongo_uri or "mongodb://127.0.0.1:1",
+        "MONGODB_DATABASE": args.mongo_db
+    })
+
+
+def synthetic_farmer(index: int, phone: str, cities: int, hindi_share: float) -> Dict[str, Any]:
+    city, state = CITIES[index % len(CITIES)]
+    round_ = (index % cities) // len(CITIES)
+    return {
+        "_id": phone,
+        "name": f"Farmer {index}",
+        "city": city if round_ == 0 else f"{city} {round_ + 1}",
+        "state": state,
+        "commodities": FARMER_COMMODITIES[index % len(FARMER_COMMODITIES)],
+        "last_message_language": "hi" if (index * 37 % 100) < hindi_share * 100 else "en"
+    }
+
+async def seed_farmers(database, count: int, prefix: str, cities: int, hindi_share: float) -> List[str]:
+    await database.farmers.delete_many({})
+    farmers = [synthetic_farmer(i, f"{prefix}{i:07d}", cities, hindi_share) for i in range(count)]
+    for start in range(0, len(farmers), 1000):
+        await database.farmers.insert_many(farmers[start:start + 1000])
+    return [farmer["_id"] for farmer in farmers]
+
+async def reset_state(main, database):
+    for cache in (main.weather_cache, main.past_weather_fallback, main.market_cache, main.llm_cache,
+                  main.translation_cache, main.profile_cache):
+        cache.clear()
+    for breaker in main.circuit_breakers.values():
+        breaker.record_success()
+    for collection in (database.market_snapshots, database.llm_cache_collection, database.scheduled_runs, database.scheduled_jobs):
+        await collection.delete_many({})
+
+
+async def upstream_calls(stub: httpx.AsyncClient) -> Dict[str, int]:
+    return (await stub.get("/_stats")).json()["calls"]
+
+def summarize(name: str, latencies: List[float], errors: int, elapsed: float, before: Dict[str, int],
+              after: Dict[str, int], requests: int) -> Dict[str, Any]:
+    calls = {upstream: after.get(upstream, 0) - before.get(upstream, 0) for upstream in stubs.UPSTREAMS}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if latencies else (0.0, 0.0, 0.0)
+    return {
+        "phase": name,
+        "requests": requests,
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "requests_per_second": round(requests / elapsed, 3) if elapsed > 0 else 0.0,
+        "latency_ms": {"p50": round(p50 * 1000, 1), "p95": round(p95 * 1000, 1), "p99": round(p99 * 1000, 1),
+                       "max": round(max(latencies, default=0.0) * 1000, 1)},
+        "upstream_calls": calls,
+        "upstream_calls_per_request": {upstream: round(count / requests, 3) for upstream, count in calls.items()} if requests else {}
+    }
+
+
+async def webhook_phase(args, main, database, client: httpx.AsyncClient, stub: httpx.AsyncClient) -> Dict[str, Any]:
+    phones = await seed_farmers(database, args.users, "91900", args.cities, args.hindi_share)
+    latencies, errors = [], 0
+
+    async def user(index: int, phone: str):
+        nonlocal errors
+        for request in range(args.requests):
+            message = MESSAGES[(index + request) % len(MESSAGES)]
+            started = time.perf_counter()
+            try:
+                response = await client.post("/mockup-webhook", json={"phone": phone, "message": message})
+                if response.status_code != 200 or str(response.json().get("advice", "")).startswith("Error"):
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    before = await upstream_calls(stub)
+    started = time.perf_counter()
+    await asyncio.gather(*(user(i, phone) for i, phone in enumerate(phones)))
+    elapsed = time.perf_counter() - started
+    return summarize("webhook", latencies, errors, elapsed, before, await upstream_calls(stub), len(latencies))
+
+async def scheduled_phase(args, main, database, client: httpx.AsyncClient, stub: httpx.AsyncClient) -> Dict[str, Any]:
+    await seed_farmers(database, args.farmers, "91800", args.cities, args.hindi_share)
+    latencies, errors, users_per_second = [], 0, []
+
+    before = await upstream_calls(stub)
+    started = time.perf_counter()
+    for run in range(args.runs):
+        if run and args.cold:
+            await reset_state(main, database)
+        run_started = time.perf_counter()
+        params = {"resume": "false"} | ({"concurrency": args.concurrency} if args.concurrency else {})
+        response = await client.get("/mockup-scheduled-run", params=params)
+        latencies.append(time.perf_counter() - run_started)
+        result = response.json() if response.status_code == 200 else {}
+        if response.status_code != 200:
+            print(f"Scheduled run failed: {response.status_code} {response.text[:500]}")
+        errors += len(result.get("errors", [])) if result else 1
+        users_per_second.append(result.get("users_per_second", 0.0))
+    elapsed = time.perf_counter() - started
+
+    summary = summarize("scheduled", latencies, errors, elapsed, before, await upstream_calls(stub), args.runs)
+    summary["farmers"] = args.farmers
+    summary["users_per_second"] = round(float(np.mean(users_per_second)), 3) if users_per_second else 0.0
+    summary["upstream_calls_per_farmer"] = {
+        upstream: round(count / (args.farmers * args.runs), 4) for upstream, count in summary["upstream_calls"].items()
+    } if args.farmers else {}
+    return summary
+
+
+def print_report(results: List[Dict[str, Any]]):
+    header = f"{'phase':<10} {'requests':>8} {'errors':>6} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        latency = result["latency_ms"]
+        print(f"{result['phase']:<10} {result['requests']:>8} {result['errors']:>6} {result['requests_per_second']:>9} "
+              f"{latency['p50']:>9} {latency['p95']:>9} {latency['p99']:>9} {latency['max']:>9}")
+    print()
+    print(f"{'upstream calls per request':<28}" + "".join(f"{upstream:>20}" for upstream in stubs.UPSTREAMS))
+    for result in results:
+        per_request = result["upstream_calls_per_request"]
+        print(f"{result['phase']:<28}" + "".join(f"{per_request.get(upstream, 0):>20}" for upstream in stubs.UPSTREAMS))
+    for result in results:
+        for name, breaker in result.get("circuit_breakers", {}).items():
+            if breaker["opened"] or breaker["rejected"]:
+                print(f"\n{result['phase']}: {name} circuit breaker {breaker['state']}, opened {breaker['opened']}x, rejected {breaker['rejected']} calls")
+    for result in results:
+        if "users_per_second" in result:
+            print(f"\nscheduled: {result['farmers']} farmers, {result['users_per_second']} users/s")
+
+
+async def run(args, main, database) -> List[Dict[str, Any]]:
+    results = []
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app), \
+            httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client, \
+            httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.stub_port}") as stub:
+        await reset_state(main, database)
+        if args.phase in ("webhook", "all") and args.users:
+            results.append(await webhook_phase(args, main, database, client, stub))
+            results[-1]["circuit_breakers"] = {name: breaker.stats() for name, breaker in main.circuit_breakers.items()}
+        if args.phase in ("scheduled", "all") and args.farmers:
+            if args.cold:
+                await reset_state(main, database)
+            results.append(await scheduled_phase(args, main, database, client, stub))
+            results[-1]["circuit_breakers"] = {name: breaker.stats() for name, breaker in main.circuit_breakers.items()}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /mockup-webhook and /mockup-scheduled-run against stub upstreams")
+    parser.add_argument("--phase", choices=["webhook", "scheduled", "all"], default="all")
+    parser.add_argument("--users", type=int, default=20, help="concurrent webhook users")
+    parser.add_argument("--requests", type=int, default=4, help="messages sent by every webhook user")
+    parser.add_argument("--farmers", type=int, default=500, help="synthetic farmers of the scheduled run")
+    parser.add_argument("--runs", type=int, default=1, help="scheduled runs")
+    parser.add_argument("--concurrency", type=int, default=None, help="scheduled run concurrency (SCHEDULED_RUN_CONCURRENCY)")
+    parser.add_argument("--cities", type=int, default=24, help="distinct cities of the synthetic farmers")
+    parser.add_argument("--hindi-share", type=float, default=0.2, help="share of farmers whose language is Hindi")
+    parser.add_argument("--cold", action="store_true", help="clear caches and snapshots between phases and runs")
+    parser.add_argument("--stub-port", type=int, default=0, help="port of the stub server (default: a free port)")
+    parser.add_argument("--mongo-uri", help="local MongoDB to use instead of mongomock")
+    parser.add_argument("--mongo-db", default="AnnaDataBench", help="database used (and emptied) by the benchmark")
+    parser.add_argument("--mongo-ms", type=float, default=1.0, help="simulated mongomock round trip")
+    parser.add_argument("--json", help="also write the results to this file")
+    stubs.add_latency_arguments(parser)
+    args = parser.parse_args()
+    args.stub_port = args.stub_port or free_port()
+
+    process = start_stubs(args)
+    try:
+        configure_environment(args)
+        import main as app_main
+        import database
+        if not args.mongo_uri:
+            from bench import fake_mongo
+            fake_mongo.use_mongomock(database, args.mongo_ms)
+        results = asyncio.run(run(args, app_main, database))
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    print_report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"settings": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
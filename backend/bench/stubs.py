@@ -0,0 +1,239 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Dict
+from urllib.parse import parse_qs
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Local stand-ins for the upstream APIs (weatherapi, WorldWeatherOnline, e-NAM, NVIDIA chat
+# completions and a LibreTranslate-compatible translator), so the backend can be benchmarked
+# without spending API credits. Every route sleeps for its configured latency (ms, with
+# +-jitter) before answering and counts its calls, see GET /_stats. --down/--hang make
+# upstreams fail with 503 or never answer, to exercise timeouts and circuit breakers.
+# Responses are deterministic per city/state, so runs with the same settings are comparable.
+#
+#   python -m bench.stubs --port 8900 --weather-ms 120 --llm-ms 900 --llm-token-ms 8
+
+UPSTREAMS = ("weatherapi", "worldweatheronline", "enam", "nvidia", "translate")
+
+latency_ms: Dict[str, float] = {name: 0.0 for name in UPSTREAMS}
+jitter = 0.1
+llm_token_ms = 0.0
+down: Dict[str, str] = {}          # upstream -> "error" (503) or "hang"
+calls: Counter = Counter()
+
+app = FastAPI()
+
+COMMODITIES = ["Wheat", "Paddy", "Maize", "Mustard", "Onion", "Potato", "Tomato", "Cotton", "Soyabean",
+               "Bengal Gram", "Green Chilli", "Cauliflower", "Brinjal", "Ginger", "Garlic", "Banana"]
+
+
+def seeded(*parts) -> random.Random:
+    return random.Random(hashlib.sha256("|".join(map(str, parts)).encode("utf-8")).hexdigest())
+
+async def upstream_call(name: str):
+    calls[name] += 1
+    delay = latency_ms[name] * (1 + random.uniform(-jitter, jitter))
+    if delay > 0:
+        await asyncio.sleep(delay / 1000)
+    if down.get(name) == "hang":
+        await asyncio.sleep(3600)
+    if down.get(name) == "error":
+        raise HTTPException(status_code=503, detail=f"{name} is down")
+
+
+@app.get("/weatherapi/v1/forecast.json")
+async def weather_forecast(q: str, days: int = 3):
+    await upstream_call("weatherapi")
+    rng = seeded("weather", q.lower())
+    now = datetime.now().replace(minute=0, second=0, microsecond=0)
+    # a third of the cities get a rainy spell, some a heat wave, the rest calm weather
+    kind = rng.choice(["rain", "heat", "calm"])
+    forecast_days = []
+    for day in range(days):
+        date = (now + timedelta(days=day)).date()
+        hours = []
+        for hour in range(24):
+            precip = rng.uniform(4, 14) if kind == "rain" and 12 <= hour <= 18 else 0.0
+            temp = rng.uniform(36, 43) if kind == "heat" and 11 <= hour <= 16 else rng.uniform(22, 33)
+            humidity = rng.uniform(80, 98) if kind == "rain" else rng.uniform(35, 70)
+            wind = rng.uniform(5, 25)
+            hours.append({
+                "time": f"{date} {hour:02d}:00", "temp_c": round(temp, 1), "humidity": round(humidity),
+                "precip_mm": round(precip, 1), "wind_kph": round(wind, 1), "gust_kph": round(wind * 1.4, 1),
+                "heatindex_c": round(temp + 2, 1), "chance_of_rain": 90 if precip else 10,
+                "condition": {"text": "Moderate rain" if precip else "Sunny"}
+            })
+        forecast_days.append({
+            "date": str(date),
+            "day": {
+                "maxtemp_c": max(h["temp_c"] for h in hours), "mintemp_c": min(h["temp_c"] for h in hours),
+                "avgtemp_c": round(sum(h["temp_c"] for h in hours) / 24, 1),
+                "totalprecip_mm": round(sum(h["precip_mm"] for h in hours), 1),
+                "daily_chance_of_rain": 90 if kind == "rain" else 10,
+                "condition": {"text": "Moderate rain" if kind == "rain" else "Sunny"}
+            },
+            "hour": hours
+        })
+    return {
+        "location": {"name": q.title(), "region": "Bench", "country": "India", "localtime": now.strftime("%Y-%m-%d %H:%M")},
+        "current": forecast_days[0]["hour"][now.hour] | {"condition": forecast_days[0]["day"]["condition"]},
+        "forecast": {"forecastday": forecast_days},
+        "alerts": {"alert": []}
+    }
+
+
+@app.get("/wwo/premium/v1/past-weather.ashx")
+async def past_weather(q: str, date: str, enddate: str):
+    await upstream_call("worldweatheronline")
+    rng = seeded("past", q.lower())
+    humid = rng.random() < 0.5
+    start, end = datetime.strptime(date, "%Y-%m-%d"), datetime.strptime(enddate, "%Y-%m-%d")
+    weather = []
+    for day in range((end - start).days + 1):
+        temps = [rng.uniform(24, 34) for _ in range(8)]
+        weather.append({
+            "date": (start + timedelta(days=day)).strftime("%Y-%m-%d"),
+            "maxtempC": str(round(max(temps))), "mintempC": str(round(min(temps))), "avgtempC": str(round(sum(temps) / 8)),
+            "hourly": [{
+                "tempC": str(round(temp)),
+                "humidity": str(round(rng.uniform(82, 96) if humid else rng.uniform(40, 70))),
+                "precipMM": str(round(rng.uniform(0.5, 3), 1) if humid and rng.random() < 0.6 else 0.0),
+                "windspeedKmph": str(round(rng.uniform(4, 20)))
+            } for temp in temps]
+        })
+    return {"data": {"weather": weather}}
+
+
+@app.post("/enam/commodity_list")
+async def enam_commodity_list(request: Request):
+    await upstream_call("enam")
+    form = {key: values[0] for key, values in parse_qs((await request.body()).decode("utf-8")).items()}
+    state_name = form.get("stateName", "")
+    rng = seeded("enam", state_name)
+    rows = []
+    for apmc in range(rng.randint(20, 40)):
+        for commodity in rng.sample(COMMODITIES, rng.randint(4, 10)):
+            modal = rng.randint(800, 9000)
+            rows.append({
+                "id": str(len(rows) + 1), "state": state_name, "apmc": f"{state_name.title()} APMC {apmc + 1}",
+                "commodity": commodity, "min_price": str(modal - rng.randint(50, 400)), "modal_price": str(modal),
+                "max_price": str(modal + rng.randint(50, 400)), "commodity_arrivals": str(rng.randint(1, 500)),
+                "commodity_traded": str(rng.randint(1, 400)), "created_at": form.get("fromDate", ""),
+                "status": "1", "Commodity_Uom": "Qui"
+            })
+    return {"status": 200, "data": rows}
+
+
+def completion_content(prompt: str) -> Dict[str, Any]:
+    """A plausible JSON answer for each of the backend's prompts"""
+    if "MongoDB operations" in prompt:
+        command = re.search(r"User command: (.*)", prompt)
+        text = command.group(1).strip().lower() if command else ""
+        found = [c for c in COMMODITIES if c.lower() in text]
+        return {"operation": "update" if found else "none", "name": None, "city": None, "state": None,
+                "commodities": {"add": found, "remove": []}}
+    if '"alert_message"' in prompt:
+        return {"alert_message": "Alert: pest and weather risk this week. Protect standing crops, delay spraying before rain."}
+    if '"recommended_actions"' in prompt:
+        return {"recommended_actions": ["Scout fields every morning", "Remove infested leaves", "Avoid excess irrigation"]}
+    return {
+        "Weather Advisory": "Rain expected over the next 48 hours, postpone irrigation and spraying.",
+        "Market Strategy": "Per e-NAM modal prices are stable, hold produce for a week if storage allows.",
+        "Cultivation Tips": "Keep field drainage channels open.",
+        "Preventive Measures": "Watch for fungal infection after the rain."
+    }
+
+
+@app.post("/nvidia/v1/chat/completions")
+async def chat_completions(request: Request):
+    await upstream_call("nvidia")
+    payload = await request.json()
+    prompt = "".join(message.get("content", "") for message in payload.get("messages", []))
+    content = json.dumps(completion_content(prompt), ensure_ascii=False)
+    pieces = [content[i:i + 4] for i in range(0, len(content), 4)]      # ~4 characters per token
+    usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(pieces), "total_tokens": len(prompt) // 4 + len(pieces)}
+
+    if not payload.get("stream"):
+        await asyncio.sleep(llm_token_ms * len(pieces) / 1000)
+        return {"choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}], "usage": usage}
+
+    async def events():
+        for piece in pieces:
+            if llm_token_ms:
+                await asyncio.sleep(llm_token_ms / 1000)
+            yield f"data: {json.dumps({'choices': [{'index': 0, 'delta': {'content': piece}}]})}\n\n"
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            yield f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n"
+        yield "data: [DONE]\n\n"
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.post("/translate")
+async def translate(request: Request):
+    await upstream_call("translate")
+    payload = await request.json()
+    text, target = payload.get("q"), payload.get("target", "en")
+    if not isinstance(text, str):
+        return JSONResponse(status_code=400, content={"error": "Invalid request: q must be a string"})
+    return {"translatedText": text if target == "en" else f"[{target}] {text}", "detectedLanguage": {"language": "en", "confidence": 90}}
+
+
+@app.get("/_stats")
+async def stats():
+    return {"calls": dict(calls), "latency_ms": latency_ms, "jitter": jitter, "llm_token_ms": llm_token_ms, "down": down}
+
+@app.post("/_reset")
+async def reset():
+    calls.clear()
+    return {"calls": {}}
+
+
+def add_latency_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--weather-ms", type=float, default=120, help="weatherapi forecast latency")
+    parser.add_argument("--wwo-ms", type=float, default=250, help="WorldWeatherOnline past weather latency")
+    parser.add_argument("--enam-ms", type=float, default=800, help="e-NAM commodity list latency")
+    parser.add_argument("--llm-ms", type=float, default=600, help="NVIDIA chat completion latency (time to first token)")
+    parser.add_argument("--llm-token-ms", type=float, default=5, help="NVIDIA time per generated token")
+    parser.add_argument("--translate-ms", type=float, default=150, help="translation latency")
+    parser.add_argument("--jitter", type=float, default=0.1, help="relative +- jitter applied to every latency")
+    parser.add_argument("--down", default="", help="comma separated upstreams answering 503, e.g. enam,nvidia")
+    parser.add_argument("--hang", default="", help="comma separated upstreams that never answer")
+
+def latency_arguments(args) -> list:
+    """The latency flags of args, to start the stub server as a subprocess"""
+    return [
+        "--weather-ms", str(args.weather_ms), "--wwo-ms", str(args.wwo_ms), "--enam-ms", str(args.enam_ms),
+        "--llm-ms", str(args.llm_ms), "--llm-token-ms", str(args.llm_token_ms),
+        "--translate-ms", str(args.translate_ms), "--jitter", str(args.jitter), "--down", args.down, "--hang", args.hang
+    ]
+
+def configure(args):
+    global jitter, llm_token_ms
+    latency_ms.update({
+        "weatherapi": args.weather_ms, "worldweatheronline": args.wwo_ms, "enam": args.enam_ms,
+        "nvidia": args.llm_ms, "translate": args.translate_ms
+    })
+    jitter = args.jitter
+    llm_token_ms = args.llm_token_ms
+    down.update({name: "error" for name in args.down.split(",") if name})
+    down.update({name: "hang" for name in args.hang.split(",") if name})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub upstream APIs for benchmarking the backend")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_latency_arguments(parser)
+    args = parser.parse_args()
+    configure(args)
+    # requests of --hang upstreams never finish, shutdown does not wait for them
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", timeout_graceful_shutdown=1)
@@ -0,0 +1,22 @@
+import asyncio
+
+import mongomock
+import pytest
+
+import database
+from bench.fake_mongo import COLLECTIONS, AsyncCollection
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """The collections of the database module on an in-memory mongomock database"""
+    db = mongomock.MongoClient()[database.MONGODB_DATABASE]
+    for attribute, collection in COLLECTIONS.items():
+        monkeypatch.setattr(database, attribute, AsyncCollection(db[collection], 0.0))
+    return db
+
+
+@pytest.fixture
+def run():
+    """Runs a coroutine to completion, the tests stay plain functions"""
+    return asyncio.run
@@ -0,0 +1,217 @@
+import os
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from pymongo import AsyncMongoClient, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+import tracing
+
+# Async access to MongoDB, so DB round trips no longer block the event loop
+# and can overlap with the outbound HTTP calls of the same request.
+MONGODB_CONNECTION_STRING = os.getenv("MONGODB_CONNECTION_STRING")
+MONGODB_DATABASE = os.getenv("MONGODB_DATABASE", "AgriUserInfo")
+
+client = AsyncMongoClient(
+    MONGODB_CONNECTION_STRING,
+    maxPoolSize=int(os.getenv("MONGODB_MAX_POOL_SIZE", "50")),
+    minPoolSize=int(os.getenv("MONGODB_MIN_POOL_SIZE", "2")),
+    maxIdleTimeMS=int(os.getenv("MONGODB_MAX_IDLE_MS", "60000")),
+    serverSelectionTimeoutMS=int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+)
+db = client[MONGODB_DATABASE]
+farmers = db['Info']
+market_snapshots = db['MarketSnapshots']
+llm_cache_collection = db['LLMCache']
+scheduled_runs = db['ScheduledRuns']
+scheduled_jobs = db['ScheduledJobs']
+
+# Only the fields the advisory/alert pipeline actually reads
+PROFILE_FIELDS = {"_id": 1, "name": 1, "city": 1, "state": 1, "commodities": 1, "last_message_language": 1}
+SCHEDULED_FIELDS = {"_id": 1, "city": 1, "state": 1, "commodities": 1, "last_message_language": 1}
+SCHEDULED_BATCH_SIZE = int(os.getenv("SCHEDULED_BATCH_SIZE", "500"))
+
+
+async def close():
+    await client.close()
+
+
+#--------------------------------------------FARMERS-------------------------------------------------------------------------------------------
+
+@tracing.traced("mongo.find_farmer")
+async def find_farmer(phone: str) -> Optional[Dict[str, Any]]:
+    return await farmers.find_one({'_id': phone}, PROFILE_FIELDS)
+
+@tracing.traced("mongo.upsert_farmer")
+async def upsert_farmer(phone: str, set_fields: Dict[str, Any], add_commodities: List[str],
+                        remove_commodities: List[str], default_language: str) -> Dict[str, Any]:
+    """
+    Applies a profile command in a single round trip (pipeline update with upsert):
+    fills the empty defaults of a new farmer, sets fields, adds commodities that are not
+    there yet and removes the given ones. Commodities are compared case-insensitively
+    ("onion" saved earlier is matched by "Onion"). Returns the document after the update.
+    """
+    unique = {}
+    for item in add_commodities:
+        unique.setdefault(item.lower(), item)
+    add_commodities = list(unique.values())
+    remove_commodities = [item.lower() for item in remove_commodities]
+    pipeline = [
+        {"$set": {
+            "name": {"$ifNull": ["$name", ""]},
+            "city": {"$ifNull": ["$city", ""]},
+            "state": {"$ifNull": ["$state", ""]},
+            "commodities": {"$ifNull": ["$commodities", []]},
+            "last_message_language": {"$ifNull": ["$last_message_language", default_language]}
+        }}
+    ]
+    if set_fields:
+        pipeline.append({"$set": {k: {"$literal": v} for k, v in set_fields.items()}})
+    if add_commodities or remove_commodities:
+        new_items = {"$filter": {
+            "input": {"$literal": add_commodities},
+            "as": "item",
+            "cond": {"$not": [{"$in": [{"$toLower": "$$item"}, {"$map": {"input": "$commodities", "in": {"$toLower": "$$this"}}}]}]}
+        }}
+        pipeline.append({"$set": {"commodities": {"$filter": {
+            "input": {"$concatArrays": ["$commodities", new_items]},
+            "as": "item",
+            "cond": {"$not": [{"$in": [{"$toLower": "$$item"}, {"$literal": remove_commodities}]}]}
+        }}}})
+    return await farmers.find_one_and_update(
+        {'_id': phone},
+        pipeline,
+        projection=PROFILE_FIELDS,
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+
+@tracing.traced("mongo.delete_farmer")
+async def delete_farmer(phone: str) -> None:
+    await farmers.delete_one({'_id': phone})
+
+async def farmer_batches(after_id: Any = None, batch_size: int = SCHEDULED_BATCH_SIZE) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Streams farmers in stable _id order, batch_size documents at a time, with only the
+    fields the scheduled run needs. after_id resumes right after an already processed farmer.
+    """
+    query = {"_id": {"$gt": after_id}} if after_id is not None else {}
+    cursor = farmers.find(query, SCHEDULED_FIELDS, sort=[("_id", 1)], batch_size=batch_size)
+    batch = []
+    async for farmer in cursor:
+        batch.append(farmer)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+async def count_farmers(after_id: Any = None) -> int:
+    query = {"_id": {"$gt": after_id}} if after_id is not None else {}
+    return await farmers.count_documents(query)
+
+async def watch_farmers() -> AsyncIterator[Dict[str, Any]]:
+    """Change events of the farmers collection (needs a replica set, e.g. Atlas)"""
+    async with await farmers.watch() as stream:
+        async for change in stream:
+            yield change
+
+
+#--------------------------------------------SCHEDULED RUN CHECKPOINTS-------------------------------------------------------------------------
+
+# one checkpoint document per run, keyed by (run_name, run_id)
+
+async def load_checkpoint(run_name: str, run_id: str) -> Optional[Dict[str, Any]]:
+    return await scheduled_runs.find_one({"_id": f"{run_name}|{run_id}"})
+
+async def save_checkpoint(run_name: str, run_id: str, **fields) -> None:
+    await scheduled_runs.update_one(
+        {"_id": f"{run_name}|{run_id}"},
+        {"$set": {**fields, "run_name": run_name, "run_id": run_id, "updated_at": datetime.utcnow()}},
+        upsert=True
+    )
+
+async def take_over_checkpoint(run_name: str, run_id: str, skip_run_ids: List[str]) -> Optional[Dict[str, Any]]:
+    """
+    Atomically marks the latest checkpoint of run_name still in status "running" (an interrupted
+    run, skip_run_ids are runs known to be alive) as resumed by run_id and returns it, so only
+    one new run continues it.
+    """
+    now = datetime.utcnow()
+    return await scheduled_runs.find_one_and_update(
+        {"run_name": run_name, "status": "running", "run_id": {"$nin": skip_run_ids}},
+        {"$set": {"status": "resumed", "resumed_by": run_id, "updated_at": now}},
+        sort=[("updated_at", -1)]
+    )
+
+
+#--------------------------------------------BACKGROUND JOBS------------------------------------------------------------------------------------
+
+async def ensure_job_indexes() -> None:
+    # queued/running jobs carry active: true, so at most one job of a kind can be active
+    await scheduled_jobs.create_index("kind", name="one_active_job_per_kind", unique=True,
+                                      partialFilterExpression={"active": True})
+
+async def create_job(job: Dict[str, Any]) -> bool:
+    """Inserts the job, False when an active job of the same kind already exists"""
+    try:
+        await scheduled_jobs.insert_one(job)
+    except DuplicateKeyError:
+        return False
+    return True
+
+async def find_job(job_id: str) -> Optional[Dict[str, Any]]:
+    return await scheduled_jobs.find_one({"_id": job_id})
+
+async def find_active_job(kind: str) -> Optional[Dict[str, Any]]:
+    """The queued or running job of this kind"""
+    return await scheduled_jobs.find_one({"kind": kind, "active": True})
+
+async def update_job(job_id: str, owner: Optional[str] = None, **fields) -> bool:
+    """Sets fields on a job, only while owner still holds it when owner is given"""
+    query = {"_id": job_id}
+    if owner is not None:
+        query["owner"] = owner
+    result = await scheduled_jobs.update_one(query, {"$set": {**fields, "updated_at": datetime.utcnow()}})
+    return result.matched_count == 1
+
+async def claim_orphaned_job(owner: str, heartbeat_before: datetime) -> Optional[Dict[str, Any]]:
+    """
+    Atomically takes over the oldest queued/running job whose heartbeat is older than
+    heartbeat_before (its instance died), so only one instance picks it up.
+    """
+    now = datetime.utcnow()
+    return await scheduled_jobs.find_one_and_update(
+        {"status": {"$in": ["queued", "running"]}, "heartbeat_at": {"$lt": heartbeat_before}},
+        {"$set": {"owner": owner, "heartbeat_at": now, "updated_at": now}, "$inc": {"attempts": 1}},
+        sort=[("created_at", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+#--------------------------------------------CACHES--------------------------------------------------------------------------------------------
+
+@tracing.traced("mongo.find_market_snapshot")
+async def find_market_snapshot(snapshot_id: str) -> Optional[Dict[str, Any]]:
+    return await market_snapshots.find_one({"_id": snapshot_id})
+
+@tracing.traced("mongo.find_latest_market_snapshot")
+async def find_latest_market_snapshot(state_name: str, oldest_date: str) -> Optional[Dict[str, Any]]:
+    """The newest snapshot of the state dated oldest_date (YYYY-MM-DD) or later"""
+    return await market_snapshots.find_one({"state": state_name, "date": {"$gte": oldest_date}}, sort=[("date", -1)])
+
+@tracing.traced("mongo.save_market_snapshot")
+async def save_market_snapshot(snapshot: Dict[str, Any]) -> None:
+    await market_snapshots.replace_one({"_id": snapshot["_id"]}, snapshot, upsert=True)
+
+@tracing.traced("mongo.find_llm_cache_entry")
+async def find_llm_cache_entry(key: str, created_after) -> Optional[Dict[str, Any]]:
+    return await llm_cache_collection.find_one({"_id": key, "created_at": {"$gt": created_after}})
+
+@tracing.traced("mongo.save_llm_cache_entry")
+async def save_llm_cache_entry(entry: Dict[str, Any]) -> None:
+    await llm_cache_collection.replace_one({"_id": entry["_id"]}, entry, upsert=True)
+
+async def ensure_llm_cache_index(ttl_seconds: int) -> None:
+    # Mongo drops expired cache documents on its own
+    await llm_cache_collection.create_index("created_at", expireAfterSeconds=ttl_seconds)
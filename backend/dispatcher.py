@@ -0,0 +1,114 @@
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# Outbound message delivery (SMS/WhatsApp). Messages go through a queue served by a few
+# concurrent workers, a token bucket keeps the send rate within the provider quota and
+# transient failures are retried with exponential backoff.
+
+
+class TokenBucket:
+    """Allows rate acquisitions per second on average, with bursts of up to burst"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:          # no limit
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class Dispatcher:
+    """
+    Queue of outbound messages for one channel. deliver() resolves once the message was
+    sent (returning what send returned) or raises the last error once retries ran out.
+    Workers start with the first delivery.
+    """
+
+    def __init__(self, name: str, send: Callable[[str, str], Awaitable[Any]], rate: float, workers: int = 8,
+                 max_retries: int = 3, backoff: float = 1.0, is_transient: Callable[[Exception], bool] = lambda e: False,
+                 queue_size: int = 1000):
+        self.name = name
+        self.send = send
+        self.bucket = TokenBucket(rate)
+        self.workers = max(1, workers)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.is_transient = is_transient
+        self.queue_size = queue_size
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+
+    def _start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def deliver(self, phone: str, message: str) -> Any:
+        if self._queue is None:
+            self._start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((phone, message, future))
+        return await future
+
+    async def _worker(self):
+        while True:
+            phone, message, future = await self._queue.get()
+            try:
+                result = await self._send_with_retries(phone, message)
+                if not future.done():
+                    future.set_result(result)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    async def _send_with_retries(self, phone: str, message: str) -> Any:
+        attempt = 0
+        while True:
+            await self.bucket.acquire()
+            try:
+                result = await self.send(phone, message)
+                self.sent += 1
+                return result
+            except Exception as e:
+                if attempt >= self.max_retries or not self.is_transient(e):
+                    self.failed += 1
+                    print(f"{self.name} delivery to {phone} failed: {e}")
+                    raise
+                self.retried += 1
+                await asyncio.sleep(self.backoff * 2 ** attempt + random.uniform(0, self.backoff))
+                attempt += 1
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self._queue = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "workers": self.workers,
+            "rate_per_second": self.bucket.rate,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried
+        }
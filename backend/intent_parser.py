@@ -0,0 +1,123 @@
+import re
+from typing import Any, Dict, List, Optional
+
+# Deterministic parser for the short profile commands users actually send
+# ("city Karnal", "state haryana", "commodities wheat, onion", "remove commodity onion",
+# "language hindi", "hello"). It emits the same command dict as llm_command_generator
+# and returns None for anything it is not sure about, so that falls back to the LLM.
+
+GREETINGS = {
+    "hi", "hii", "hello", "hey", "hola", "namaste", "namaskar", "good morning", "good afternoon",
+    "good evening", "thanks", "thank you", "ok", "okay", "help", "start"
+}
+
+LANGUAGES = {
+    "english": "en", "hindi": "hi", "bengali": "bn", "bangla": "bn", "tamil": "ta", "telugu": "te",
+    "marathi": "mr", "gujarati": "gu", "kannada": "kn", "malayalam": "ml", "punjabi": "pa",
+    "odia": "or", "oriya": "or", "urdu": "ur", "assamese": "as"
+}
+
+STATES = {
+    "ANDHRA PRADESH", "ARUNACHAL PRADESH", "ASSAM", "BIHAR", "CHHATTISGARH", "GOA", "GUJARAT",
+    "HARYANA", "HIMACHAL PRADESH", "JHARKHAND", "KARNATAKA", "KERALA", "MADHYA PRADESH",
+    "MAHARASHTRA", "MANIPUR", "MEGHALAYA", "MIZORAM", "NAGALAND", "ODISHA", "PUNJAB", "RAJASTHAN",
+    "SIKKIM", "TAMIL NADU", "TELANGANA", "TRIPURA", "UTTAR PRADESH", "UTTARAKHAND", "WEST BENGAL",
+    "ANDAMAN AND NICOBAR ISLANDS", "CHANDIGARH", "DADRA AND NAGAR HAVELI AND DAMAN AND DIU",
+    "DELHI", "JAMMU AND KASHMIR", "LADAKH", "LAKSHADWEEP", "PUDUCHERRY"
+}
+STATE_ALIASES = {"UP": "UTTAR PRADESH", "MP": "MADHYA PRADESH", "AP": "ANDHRA PRADESH", "ORISSA": "ODISHA",
+                 "UTTARANCHAL": "UTTARAKHAND", "PONDICHERRY": "PUDUCHERRY", "NCT OF DELHI": "DELHI", "J&K": "JAMMU AND KASHMIR"}
+
+# Values containing these are questions or other requests rather than a place/crop name
+STOP_WORDS = {
+    "not", "no", "what", "how", "why", "when", "where", "which", "is", "are", "was", "my", "me", "i",
+    "you", "your", "the", "this", "that", "it", "account", "profile", "data", "everything", "all",
+    "weather", "price", "prices", "rate", "rates", "today", "tomorrow", "dying", "damaged", "please",
+    # prepositions and articles: "add fertilizer to wheat", "i live in a village", "remove pests from wheat"
+    "a", "an", "in", "into", "to", "from", "of", "for", "on", "at", "with", "by", "near"
+}
+
+# Free-text names and cities longer than this are more likely a sentence ("i am from karnal haryana")
+MAX_WORDS = {"name": 3, "city": 2}
+
+NAME_WORDS = r"[a-z][a-z .'-]{0,40}"
+PATTERNS = [
+    ("name", re.compile(rf"^(?:my name is|name is|set name to|change name to|name)\s*:?\s*({NAME_WORDS})$")),
+    ("city", re.compile(rf"^(?:my city is|i live in|i am from|set city to|change city to|city is|city)\s*:?\s*({NAME_WORDS})$")),
+    ("state", re.compile(rf"^(?:my state is|set state to|change state to|state is|state)\s*:?\s*({NAME_WORDS}|j&k)$")),
+    ("remove", re.compile(r"^(?:remove|delete)\s+(?:the\s+)?(?:commodities|commodity|crops|crop)?\s*:?\s*([a-z][a-z ,()&-]*)$")),
+    # a bare "crop"/"crops"/"commodity" prefix is left to the LLM, "crop insurance" is a question, not a crop
+    ("add", re.compile(r"^(?:add|my commodities are|my crops are|i grow|commodities)\s*(?:commodities|commodity|crops|crop)?\s*:?\s*([a-z][a-z ,()&-]*)$")),
+    ("language", re.compile(r"^(?:change language to|set language to|reply in|talk in|speak in|language is|language)\s*:?\s*([a-z]+)(?: language)?$"))
+]
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.lower().replace("’", "'").split()).strip(" .!?")
+
+
+def is_state(value: str) -> bool:
+    return value.upper() in STATES or value.upper() in STATE_ALIASES
+
+
+def split_items(value: str) -> List[str]:
+    """'wheat, onion and rice' -> ['Wheat', 'Onion', 'Rice']"""
+    items = re.split(r"\s*(?:,|&|\band\b)\s*", value)
+    return [item.strip().title() for item in items if item.strip()]
+
+
+def parse_clause(clause: str, command: Dict[str, Any]) -> bool:
+    """Applies one clause to command, False when it does not match the grammar"""
+    if clause in GREETINGS:
+        return True
+    for kind, pattern in PATTERNS:
+        match = pattern.match(clause)
+        if not match:
+            continue
+        value = match.group(1).strip()
+        words = re.findall(r"[a-z]+", value)
+        if kind != "language" and STOP_WORDS.intersection(words):
+            return False
+        if len(value.split()) > MAX_WORDS.get(kind, len(value.split())):
+            return False
+        if kind == "city" and any(is_state(" ".join(words[i:])) for i in range(1, len(words))):
+            return False        # city followed by its state, left to the LLM to split
+        if kind == "name":
+            command["name"] = value.title()
+        elif kind == "city":
+            command["city"] = value.title()
+        elif kind == "state":
+            state = STATE_ALIASES.get(value.upper(), value.upper())
+            if state not in STATES:
+                return False
+            command["state"] = state
+        elif kind == "language":
+            if value not in LANGUAGES:
+                return False
+            command["last_message_language"] = LANGUAGES[value]
+        else:
+            items = split_items(value)
+            if not items:
+                return False
+            command["commodities"][kind].extend(items)
+        return True
+    return False
+
+
+def parse_command(english_input: str, phone: str) -> Optional[Dict[str, Any]]:
+    """
+    Command dict for execute_mongodb_command, or None when the message needs the LLM.
+    Several commands can be sent on separate lines or separated by ';'.
+    """
+    command = {"operation": "none", "_id": phone, "commodities": {"add": [], "remove": []}}
+    clauses = [normalize(clause) for clause in re.split(r"[\n;]+", english_input or "")]
+    clauses = [clause for clause in clauses if clause]
+    if not clauses:
+        return None
+    for clause in clauses:
+        if not parse_clause(clause, command):
+            return None
+    if any(key in command for key in ("name", "city", "state", "last_message_language")) or \
+            command["commodities"]["add"] or command["commodities"]["remove"]:
+        command["operation"] = "update"
+    return command
@@ -0,0 +1,142 @@
+import asyncio
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import database
+
+# Long running work (the scheduled alert runs) is executed as background jobs instead of
+# inside the HTTP request. Job documents live in Mongo: the owning instance refreshes a
+# heartbeat while it works, and any instance claims jobs whose heartbeat went stale.
+
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "15"))
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "60"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "30"))
+
+INSTANCE_ID = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+# kind -> async handler(job, report_progress) returning the job result
+Handler = Callable[[Dict[str, Any], Callable[[Dict[str, Any]], Awaitable[None]]], Awaitable[Dict[str, Any]]]
+handlers: Dict[str, Handler] = {}
+running: Dict[str, asyncio.Task] = {}
+
+
+def register(kind: str):
+    """Decorator registering the handler of a job kind"""
+    def decorator(handler: Handler) -> Handler:
+        handlers[kind] = handler
+        return handler
+    return decorator
+
+
+async def enqueue(kind: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Creates a job and starts it on this instance. When a job of the same kind is still
+    queued or running (e.g. a retried scheduler call, also from another instance) that
+    job is returned instead of a second one. A unique index on the kind of active jobs
+    makes this atomic, a job whose owner died is left to claim_orphans.
+    """
+    while True:
+        now = datetime.utcnow()
+        job = {
+            "_id": uuid.uuid4().hex,
+            "kind": kind,
+            "params": params or {},
+            "status": "queued",
+            "active": True,
+            "owner": INSTANCE_ID,
+            "attempts": 1,
+            "progress": {},
+            "created_at": now,
+            "heartbeat_at": now,
+            "updated_at": now
+        }
+        if await database.create_job(job):
+            start(job)
+            return job
+        active = await database.find_active_job(kind)
+        if active is not None:
+            return active
+        # the active job finished in between, try again
+
+
+def start(job: Dict[str, Any]) -> None:
+    running[job["_id"]] = asyncio.create_task(_run(job))
+
+
+def _ownership_lost(job_id: str, task: asyncio.Task) -> None:
+    # another instance took the job over (our heartbeat went stale), it continues the run
+    print(f"Job {job_id} was taken over by another instance, stopping here")
+    task.cancel()
+
+async def _heartbeat(job_id: str, task: asyncio.Task):
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+        if not await database.update_job(job_id, owner=INSTANCE_ID, heartbeat_at=datetime.utcnow()):
+            _ownership_lost(job_id, task)
+            return
+
+async def _run(job: Dict[str, Any]):
+    job_id = job["_id"]
+    task = asyncio.current_task()
+    heartbeat = asyncio.create_task(_heartbeat(job_id, task))
+    # progress of an earlier owner is kept, the handler resumes from its checkpoint
+    base = dict(job.get("progress") or {})
+
+    async def report_progress(progress: Dict[str, Any]):
+        merged = {key: base.get(key, 0) + value if isinstance(value, (int, float)) else value
+                  for key, value in progress.items()}
+        if not await database.update_job(job_id, owner=INSTANCE_ID, progress=merged, heartbeat_at=datetime.utcnow()):
+            _ownership_lost(job_id, task)
+
+    try:
+        await database.update_job(job_id, owner=INSTANCE_ID, status="running",
+                                  started_at=job.get("started_at") or datetime.utcnow())
+        result = await handlers[job["kind"]](job, report_progress)
+        await database.update_job(job_id, owner=INSTANCE_ID, status="completed", active=False, result=result,
+                                  finished_at=datetime.utcnow())
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"Job {job_id} ({job['kind']}) failed: {e}")
+        await database.update_job(job_id, owner=INSTANCE_ID, status="failed", active=False, error=str(e),
+                                  finished_at=datetime.utcnow())
+    finally:
+        heartbeat.cancel()
+        running.pop(job_id, None)
+
+
+async def claim_orphans() -> int:
+    """Starts every job whose owner stopped sending heartbeats, returns how many were claimed"""
+    claimed = 0
+    while True:
+        job = await database.claim_orphaned_job(INSTANCE_ID, datetime.utcnow() - timedelta(seconds=JOB_STALE_SECONDS))
+        if job is None:
+            return claimed
+        if job["kind"] not in handlers:
+            await database.update_job(job["_id"], owner=INSTANCE_ID, status="failed", active=False,
+                                      error=f"Unknown job kind {job['kind']!r}")
+            continue
+        print(f"Picked up orphaned job {job['_id']} ({job['kind']})")
+        start(job)
+        claimed += 1
+
+async def watch_orphans():
+    """Background loop of every instance, picks up jobs of instances that died"""
+    indexed = False
+    while True:
+        try:
+            if not indexed:
+                await database.ensure_job_indexes()
+                indexed = True
+            await claim_orphans()
+        except Exception as e:
+            print(f"Orphaned job check failed: {e}")
+        await asyncio.sleep(JOB_POLL_SECONDS)
+
+
+async def shutdown():
+    for task in list(running.values()):
+        task.cancel()
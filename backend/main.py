@@ -1,20 +1,38 @@
 from langgraph.graph import StateGraph, START, END
-from typing import TypedDict, Dict, List, Optional, Any, Literal
+from langgraph.config import get_stream_writer
+from langchain_core.runnables import RunnableConfig
+from typing import TypedDict, Dict, List, Optional, Any, Literal, Annotated, Callable
 from dotenv import load_dotenv
 load_dotenv()
 import os
-import requests
+import httpx
 from datetime import datetime, timedelta
 import json
 import string
-from pymongo import MongoClient
+import time
+import hashlib
+import uuid
 from fastapi import FastAPI, Request, Response, status
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
 from twilio.rest import Client
-from fastapi.responses import JSONResponse
-from googletrans import Translator
+from twilio.http.async_http_client import AsyncTwilioHttpClient
+from twilio.base.exceptions import TwilioRestException
+from pymongo.errors import PyMongoError
+import aiohttp
+from fastapi.responses import JSONResponse, StreamingResponse
+from googletrans import Translator, LANGUAGES, LANGCODES
 import asyncio
+from cache import TTLCache
+import database
+import alert_rules
+import prompt_format
+import intent_parser
+import jobs
+from dispatcher import Dispatcher
+from resilience import SingleFlight, CircuitBreaker, CircuitBreakerTransport
+import metrics
+import tracing
 
 app = FastAPI()
 
@@ -27,29 +45,240 @@ app.add_middleware(
 )
 
 user_desired_language = None
-MONGODB_CONNECTION_STRING = os.getenv("MONGODB_CONNECTION_STRING")
 NVIDIA_API_KEY = os.getenv("NVIDIA_API_KEY")
 TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
 TWILIO_PHONE_NUMBER = os.getenv("TWILIO_PHONE_NUMBER")
 
-twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+# created on startup, its aiohttp session needs the running event loop
+twilio_client: Optional[Client] = None
+
+# Shared async HTTP client for every outbound call. httpx keeps a keep-alive
+# pool per host, so weatherapi, e-NAM and NVIDIA calls reuse their connections
+# instead of opening a new TLS session for every farmer.
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "40"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+
+# Every upstream gets its own (shorter) timeout and a circuit breaker: after
+# CIRCUIT_FAILURE_THRESHOLD consecutive failures its calls fail immediately for
+# CIRCUIT_RESET_SECONDS, then one probe request decides whether it is back.
+WEATHER_API_TIMEOUT = float(os.getenv("WEATHER_API_TIMEOUT", "5"))
+WWO_API_TIMEOUT = float(os.getenv("WWO_API_TIMEOUT", "8"))
+ENAM_TIMEOUT = float(os.getenv("ENAM_TIMEOUT", "8"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "20"))
+TRANSLATE_TIMEOUT = float(os.getenv("TRANSLATE_TIMEOUT", "5"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+def upstream_timeout(seconds: float) -> httpx.Timeout:
+    return httpx.Timeout(seconds, connect=min(seconds, HTTP_CONNECT_TIMEOUT))
+
+# the breaker transport rejects calls to an upstream with an open breaker before they reach /metrics,
+# the inner transports record latency/status per upstream host and a span per request for tracing
+breaker_transport = CircuitBreakerTransport(metrics.InstrumentedTransport(tracing.TracedTransport(httpx.AsyncHTTPTransport(
+    limits=httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=30,
+    ),
+))))
+http_client = httpx.AsyncClient(
+    timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+    transport=breaker_transport,
+)
+
+circuit_breakers: Dict[str, CircuitBreaker] = {}
+
+def upstream_breaker(name: str, url_prefix: Optional[str] = None) -> CircuitBreaker:
+    """Circuit breaker of an upstream, applied to every http_client request under url_prefix"""
+    breaker = circuit_breakers[name] = CircuitBreaker(name, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS)
+    if url_prefix:
+        breaker_transport.guard(url_prefix, breaker)
+    return breaker
+
+@app.on_event("shutdown")
+async def close_http_client():
+    await http_client.aclose()
+
+@app.on_event("shutdown")
+async def close_database():
+    await database.close()
 
-client = MongoClient(MONGODB_CONNECTION_STRING)
-db = client['AgriUserInfo']
-farmers = db['Info']
+def merge_api_data(current: Dict[str, Any], update: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Reducer for api_data: fetch nodes running in the same step each return
+    only their own key, and the results are merged instead of overwritten.
+    """
+    if not update:
+        return current or {}
+    return {**(current or {}), **update}
 
 class AdvisoryState(TypedDict):
     workflow_type: Literal["user", "scheduled_run"]
     user_number: str
     user_input: Optional[Dict[str, str]]
-    api_data: Dict[str, Any]
+    api_data: Annotated[Dict[str, Any], merge_api_data]
     advice: List[str]
     alert_message: str
     emergency_flag: bool
     language: str
+    user_location: Optional[str]
+    user_state: Optional[str]
+    user_commodities: Optional[List[str]]
+    profile: Optional[Dict[str, Any]]
+
+# Farmer profiles are read through a process-wide cache, execute_mongodb_command
+# writes the updated document back into it. With PROFILE_CHANGE_STREAM=1 a Mongo
+# change stream also evicts profiles changed by other instances.
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "300"))
+PROFILE_CHANGE_STREAM = os.getenv("PROFILE_CHANGE_STREAM", "0") == "1"
+profile_cache = TTLCache("farmer_profiles", ttl=PROFILE_CACHE_TTL, maxsize=int(os.getenv("PROFILE_CACHE_SIZE", "10000")))
+
+async def get_farmer_profile(phone: str) -> Optional[Dict[str, Any]]:
+    """Farmer document for a phone number, from profile_cache or MongoDB"""
+    profile = profile_cache.get(phone)
+    if profile is None:
+        profile = await database.find_farmer(phone)
+        if profile is not None:
+            profile_cache.set(phone, profile)
+    return profile
+
+async def state_profile(state: AdvisoryState) -> Dict[str, Any]:
+    """Profile loaded into the state for this request, falls back to the cache when the caller did not load it"""
+    return state.get("profile") or await get_farmer_profile(state["user_number"]) or {}
+
+async def _watch_profile_changes():
+    try:
+        async for change in database.watch_farmers():
+            profile_cache.delete(change.get("documentKey", {}).get("_id"))
+    except Exception as e:
+        # change streams need a replica set (e.g. Atlas), the TTL still bounds staleness
+        print(f"Profile change stream stopped: {e}")
+
+_profile_watcher: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def start_profile_change_stream():
+    global _profile_watcher
+    if PROFILE_CHANGE_STREAM:
+        _profile_watcher = asyncio.create_task(_watch_profile_changes())
+
+
+ENAM_URL = os.getenv("ENAM_URL", 'https://enam.gov.in/web/Ajax_ctrl/commodity_list')
+ENAM_HEADERS = {
+    'authority': 'enam.gov.in',
+    'accept': 'application/json, text/javascript, */*; q=0.01',
+    'accept-language': 'en-US,en;q=0.9',
+    'content-type': 'application/x-www-form-urlencoded; charset=UTF-8',
+    'origin': 'https://enam.gov.in',
+    'referer': 'https://enam.gov.in/web/dashboard/trade-data',
+    'sec-ch-ua': '"Not)A;Brand";v="8", "Chromium";v="138", "Microsoft Edge";v="138"',
+    'sec-ch-ua-mobile': '?0',
+    'sec-ch-ua-platform': '"Windows"',
+    'sec-fetch-dest': 'empty',
+    'sec-fetch-mode': 'cors',
+    'sec-fetch-site': 'same-origin',
+    'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36 Edg/138.0.0.0',
+    'x-requested-with': 'XMLHttpRequest'
+}
+enam_breaker = upstream_breaker("enam", ENAM_URL)
+
+# e-NAM returns the same (stateName, today) list to every farmer of a state, so
+# one snapshot per (state, date) is kept in Mongo (shared by all instances and
+# survives restarts) with an in-process copy in front of it. Snapshots older than
+# MARKET_SNAPSHOT_TTL, or from a previous day (at most MARKET_SNAPSHOT_MAX_DAYS old),
+# are served with their date while a refresh runs in the background (stale-while-revalidate).
+MARKET_SNAPSHOT_TTL = float(os.getenv("MARKET_SNAPSHOT_TTL", "3600"))
+MARKET_SNAPSHOT_MAX_DAYS = int(os.getenv("MARKET_SNAPSHOT_MAX_DAYS", "2"))
+market_cache = TTLCache("enam_market", ttl=MARKET_SNAPSHOT_TTL, maxsize=64)
+_market_refreshing: Dict[tuple, asyncio.Task] = {}
+
+async def fetch_enam_commodities(state_name: str, day: str) -> Dict[str, Any]:
+    """Raw commodity list for a state from e-NAM, raises httpx.HTTPError/ValueError on failure"""
+    data = {
+        'language': 'en',
+        'stateName': state_name,
+        'apmcName': '-- Select APMCs --',
+        'fromDate': day,
+        'toDate': day
+    }
+    response = await http_client.post(ENAM_URL, headers=ENAM_HEADERS, data=data, timeout=upstream_timeout(ENAM_TIMEOUT))
+    response.raise_for_status()
+    return response.json()
+
+async def refresh_market_snapshot(state_name: str, day: str) -> Dict[str, Any]:
+    """Fetches a fresh snapshot from e-NAM and stores it in Mongo and in market_cache"""
+    snapshot = {
+        "_id": f"{state_name}|{day}",
+        "state": state_name,
+        "date": day,
+        "data": await fetch_enam_commodities(state_name, day),
+        "fetched_at": datetime.utcnow()
+    }
+    market_cache.set((state_name, day), snapshot)
+    try:
+        await database.save_market_snapshot(snapshot)
+    except PyMongoError as e:
+        # the fresh data is still served, only other instances miss it
+        print(f"Market snapshot save failed for {state_name}: {e}")
+    return snapshot
 
-def market_price_api(state: AdvisoryState):
+async def _refresh_market_snapshot_in_background(state_name: str, day: str):
+    try:
+        await refresh_market_snapshot(state_name, day)
+    except (httpx.HTTPError, ValueError, PyMongoError) as e:
+        print(f"Market snapshot refresh failed for {state_name}: {e}")
+    finally:
+        _market_refreshing.pop((state_name, day), None)
+
+market_flights = SingleFlight("enam")
+
+async def _load_market_snapshot(state_name: str, today: str) -> tuple:
+    """
+    (snapshot, fetched): the stored snapshot of today or the latest one of the last
+    MARKET_SNAPSHOT_MAX_DAYS days, e-NAM only when there is none (or Mongo is failing)
+    """
+    oldest = (datetime.now() - timedelta(days=MARKET_SNAPSHOT_MAX_DAYS)).strftime('%Y-%m-%d')
+    try:
+        snapshot = (await database.find_market_snapshot(f"{state_name}|{today}")
+                    or await database.find_latest_market_snapshot(state_name, oldest))
+    except PyMongoError as e:
+        print(f"Market snapshot lookup failed for {state_name}: {e}")
+        snapshot = None
+    if snapshot is None:
+        return await refresh_market_snapshot(state_name, today), True
+    market_cache.set((state_name, today), snapshot)
+    return snapshot, False
+
+async def get_market_snapshot(state_name: str) -> Dict[str, Any]:
+    """
+    e-NAM commodity list for a state, from the in-process copy, then Mongo, then e-NAM.
+    Only blocks on e-NAM when no snapshot for the state exists at all.
+    """
+    state_name = state_name.strip().upper()
+    today = datetime.now().strftime('%Y-%m-%d')
+    key = (state_name, today)
+
+    snapshot = market_cache.get(key)
+    if snapshot is None:
+        # concurrent misses for the same state share the Mongo lookup / e-NAM fetch
+        snapshot, fetched = await market_flights.do(key, lambda: _load_market_snapshot(state_name, today))
+        if fetched:
+            return snapshot["data"]
+
+    age = (datetime.utcnow() - snapshot["fetched_at"]).total_seconds()
+    if (snapshot["date"] != today or age > MARKET_SNAPSHOT_TTL) and key not in _market_refreshing:
+        _market_refreshing[key] = asyncio.create_task(_refresh_market_snapshot_in_background(state_name, today))
+    if snapshot["date"] != today and isinstance(snapshot["data"], dict):
+        # an older day's prices, the advisory prompt shows their date
+        return {**snapshot["data"], "snapshot_date": snapshot["date"]}
+    return snapshot["data"]
+
+MARKET_UNAVAILABLE_MESSAGE = "Market prices from e-NAM are temporarily unavailable."
+
+async def market_price_api(state: AdvisoryState):
     """
     Fetches and parses commodity data for a given state from e-NAM
     Returns a list of dictionaries with parsed commodity details
@@ -58,58 +287,24 @@ def market_price_api(state: AdvisoryState):
     if state.get("user_state"):
         State = state["user_state"]
     else:
-        # fallback: try to get from DB if needed
-        user = farmers.find_one({'_id': state["user_number"]})
-        State = user.get("state") if user else None
+        # fallback: profile loaded once for the request
+        State = (await state_profile(state)).get("state")
 
     if not State:
-        updated_api_data = dict(state["api_data"])
-        updated_api_data["market"] = "Please set your state, just type in 'state' and your state name."
-        return {"api_data": updated_api_data}
+        return {"api_data": {"market": "Please set your state, just type in 'state' and your state name."}}
         # return {"error": "State not provided"}
     
-    url = 'https://enam.gov.in/web/Ajax_ctrl/commodity_list'
-    
-    headers = {
-        'authority': 'enam.gov.in',
-        'accept': 'application/json, text/javascript, */*; q=0.01',
-        'accept-language': 'en-US,en;q=0.9',
-        'content-type': 'application/x-www-form-urlencoded; charset=UTF-8',
-        'origin': 'https://enam.gov.in',
-        'referer': 'https://enam.gov.in/web/dashboard/trade-data',
-        'sec-ch-ua': '"Not)A;Brand";v="8", "Chromium";v="138", "Microsoft Edge";v="138"',
-        'sec-ch-ua-mobile': '?0',
-        'sec-ch-ua-platform': '"Windows"',
-        'sec-fetch-dest': 'empty',
-        'sec-fetch-mode': 'cors',
-        'sec-fetch-site': 'same-origin',
-        'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36 Edg/138.0.0.0',
-        'x-requested-with': 'XMLHttpRequest'
-    }
-    
-    today = datetime.now().strftime('%Y-%m-%d')
-    data = {
-        'language': 'en',
-        'stateName': State,
-        'apmcName': '-- Select APMCs --',
-        'fromDate': today,
-        'toDate': today
-    }
-    
     try:
-        response = requests.post(url, headers=headers, data=data)
-        response.raise_for_status()
-        json_data = response.json()
+        json_data = await get_market_snapshot(State)
 
         formatted_data = json_data          #format_for_whatsapp(json_data)
 
-        updated_api_data = dict(state["api_data"])
-        updated_api_data["market"] = formatted_data
-        return {"api_data": updated_api_data}
+        return {"api_data": {"market": formatted_data}}
 
-    except (requests.exceptions.RequestException, ValueError) as e:
+    except (httpx.HTTPError, ValueError, PyMongoError) as e:
+        # no recent snapshot of the state and e-NAM is failing (or its breaker is open)
         print(f"Error occurred: {e}")
-        return []
+        return {"api_data": {"market": MARKET_UNAVAILABLE_MESSAGE}}
 
 def format_for_whatsapp(commodity_data):
     messages = []
@@ -127,115 +322,181 @@ def format_for_whatsapp(commodity_data):
     return messages
 
 
-def weather_data_api(state: AdvisoryState, days=3):
+# weatherapi.com forecasts only refresh about hourly, so they are cached per
+# (normalized city, days). A longer horizon entry also serves shorter requests.
+WEATHER_CACHE_TTL = float(os.getenv("WEATHER_CACHE_TTL", "1800"))
+WEATHER_CACHE_MAX_DAYS = 3
+# how long past its TTL a forecast may still be served while weatherapi is down, its
+# localtime is taken as "now" by the alert rules, so hours that already passed would be warned about
+WEATHER_STALE_MAX_SECONDS = float(os.getenv("WEATHER_STALE_MAX_SECONDS", "7200"))
+weather_cache = TTLCache("weatherapi_forecast", ttl=WEATHER_CACHE_TTL, maxsize=int(os.getenv("WEATHER_CACHE_SIZE", "2048")))
+weather_flights = SingleFlight("weatherapi")
+WEATHER_API_URL = os.getenv("WEATHER_API_URL", "http://api.weatherapi.com/v1/forecast.json")
+weather_breaker = upstream_breaker("weatherapi", WEATHER_API_URL)
+
+def _forecast_days(res: Dict[str, Any], days: int) -> Dict[str, Any]:
+    forecast = res.get('forecast', {})
+    return {**res, 'forecast': {**forecast, 'forecastday': forecast.get('forecastday', [])[:days]}}
+
+async def fetch_weather_forecast(city: str, days: int, timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Raw forecast.json response from weatherapi.com, served from weather_cache when possible.
+    When weatherapi fails (or its breaker is open) a cached forecast expired less than
+    WEATHER_STALE_MAX_SECONDS ago is returned.
+    Raises httpx.HTTPError on failed requests without any cached forecast.
+    """
+    key = " ".join(city.lower().split())
+    for cached_days in range(days, WEATHER_CACHE_MAX_DAYS + 1):
+        if weather_cache.peek((key, cached_days)) is not None:
+            res = weather_cache.get((key, cached_days))
+            return res if cached_days == days else _forecast_days(res, days)
+    weather_cache.misses += 1
+
+    async def fetch():
+        api_key = os.getenv("WEATHER_API_KEY")
+        url = f"{WEATHER_API_URL}?key={api_key}&q={city}&days={days}&aqi=no&alerts=yes"
+        response = await http_client.get(url, timeout=upstream_timeout(timeout or WEATHER_API_TIMEOUT))
+        response.raise_for_status()
+        res = response.json()
+        weather_cache.set((key, days), res)
+        return res
+
+    try:
+        # concurrent misses for the same city share one request
+        return await weather_flights.do((key, days), fetch)
+    except httpx.HTTPError:
+        for cached_days in range(days, WEATHER_CACHE_MAX_DAYS + 1):
+            res = weather_cache.get_stale((key, cached_days), max_stale=WEATHER_STALE_MAX_SECONDS)
+            if res is not None:
+                return _forecast_days(res, days)
+        raise
+
+
+async def weather_data_api(state: AdvisoryState, days=3):
     city = None
     if state.get("user_location"):
         city = state["user_location"]
     else:
-        # fallback: try to get from DB if needed
-        user = farmers.find_one({'_id': state["user_number"]})
-        city = user.get("city") if user else None
+        # fallback: profile loaded once for the request
+        city = (await state_profile(state)).get("city") or ""
 
     if not city.strip():
-        updated_api_data = dict(state["api_data"])
-        updated_api_data["weather"] = "Please set your city, just type in 'city' and your city name."
-        return {"api_data": updated_api_data}
+        return {"api_data": {"weather": "Please set your city, just type in 'city' and your city name."}}
         # return {"error": "City not provided"}
     
-    api_key = os.getenv("WEATHER_API_KEY")
-    url = f"http://api.weatherapi.com/v1/forecast.json?key={api_key}&q={city}&days={days}&aqi=no&alerts=yes"
-    response = requests.get(url)
-    res = response.json()
-
-    if response.status_code == 200:
-        location = res.get('location', {})
-        city = location.get('name', '')
-        region = location.get('region', '')
-        country = location.get('country', '')
-        localtime = location.get('localtime', '')
-
-        # Current weather info
-        current = res.get('current', {})
-        temp_c = current.get('temp_c', None)
-        condition = current.get('condition', {}).get('text', '')
-        humidity = current.get('humidity', None)
-        precip_mm = current.get('precip_mm', None)
-        wind_kph = current.get('wind_kph', None)
-
-        # Forecast info (for each day)
-        forecast_days = []
-        for day in res.get('forecast', {}).get('forecastday', []):
-            date = day.get('date', '')
-            day_info = day.get('day', {})
-            max_temp = day_info.get('maxtemp_c', None)
-            min_temp = day_info.get('mintemp_c', None)
-            avg_temp = day_info.get('avgtemp_c', None)
-            total_rain = day_info.get('totalprecip_mm', None)
-            daily_condition = day_info.get('condition', {}).get('text', '')
-            chance_of_rain = day_info.get('daily_chance_of_rain', None)
-
-            forecast_days.append({
-                'date': date,
-                'max_temp_c': max_temp,
-                'min_temp_c': min_temp,
-                'avg_temp_c': avg_temp,
-                'total_precip_mm': total_rain,
-                'condition': daily_condition,
-                'chance_of_rain': chance_of_rain
-            })
-
-        alerts = []
-        if 'alerts' in res and 'alert' in res['alerts']:
-            for alert in res['alerts']['alert']:
-                alerts.append(alert.get('headline', ''))
-
-        data = {
-            'location': {
-            'city': city,
-            'region': region,
-            'country': country,
-            'localtime': localtime
-            },
-            'current_weather': {
-            'temp_c': temp_c,
-            'condition': condition,
-            'humidity': humidity,
-            'precip_mm': precip_mm,
-            'wind_kph': wind_kph
-            },
-            'forecast': forecast_days,
-            'alerts': alerts
-        }
-
-        # state["api_data"]["weather"] = data
-        
-        # return {"api_data": {"weather": data}}
-        updated_api_data = dict(state["api_data"])
-        updated_api_data["weather"] = data
-        return {"api_data": updated_api_data}
-    
-    else:
-        print(f"Error: {response.status_code} - {response.text}")
+    try:
+        res = await fetch_weather_forecast(city, days)
+    except (httpx.HTTPError, ValueError) as e:
+        print(f"Error: {e}")
         return None
 
+    location = res.get('location', {})
+    city = location.get('name', '')
+    region = location.get('region', '')
+    country = location.get('country', '')
+    localtime = location.get('localtime', '')
+
+    # Current weather info
+    current = res.get('current', {})
+    temp_c = current.get('temp_c', None)
+    condition = current.get('condition', {}).get('text', '')
+    humidity = current.get('humidity', None)
+    precip_mm = current.get('precip_mm', None)
+    wind_kph = current.get('wind_kph', None)
+
+    # Forecast info (for each day)
+    forecast_days = []
+    for day in res.get('forecast', {}).get('forecastday', []):
+        date = day.get('date', '')
+        day_info = day.get('day', {})
+        max_temp = day_info.get('maxtemp_c', None)
+        min_temp = day_info.get('mintemp_c', None)
+        avg_temp = day_info.get('avgtemp_c', None)
+        total_rain = day_info.get('totalprecip_mm', None)
+        daily_condition = day_info.get('condition', {}).get('text', '')
+        chance_of_rain = day_info.get('daily_chance_of_rain', None)
 
-def pest_alert_api(state: AdvisoryState, days=7):
+        forecast_days.append({
+            'date': date,
+            'max_temp_c': max_temp,
+            'min_temp_c': min_temp,
+            'avg_temp_c': avg_temp,
+            'total_precip_mm': total_rain,
+            'condition': daily_condition,
+            'chance_of_rain': chance_of_rain
+        })
+
+    alerts = []
+    if 'alerts' in res and 'alert' in res['alerts']:
+        for alert in res['alerts']['alert']:
+            alerts.append(alert.get('headline', ''))
+
+    data = {
+        'location': {
+        'city': city,
+        'region': region,
+        'country': country,
+        'localtime': localtime
+        },
+        'current_weather': {
+        'temp_c': temp_c,
+        'condition': condition,
+        'humidity': humidity,
+        'precip_mm': precip_mm,
+        'wind_kph': wind_kph
+        },
+        'forecast': forecast_days,
+        'alerts': alerts
+    }
+
+    return {"api_data": {"weather": data}}
+
+
+wwo_flights = SingleFlight("worldweatheronline")
+WWO_API_URL = os.getenv("WWO_API_URL", "https://api.worldweatheronline.com/premium/v1/past-weather.ashx")
+wwo_breaker = upstream_breaker("worldweatheronline", WWO_API_URL)
+
+# last successful past weather per city, served (up to a day old) while WorldWeatherOnline fails
+past_weather_fallback = TTLCache("wwo_past_weather_fallback", ttl=float(os.getenv("PAST_WEATHER_FALLBACK_TTL", "86400")),
+                                 maxsize=int(os.getenv("WEATHER_CACHE_SIZE", "2048")))
+
+async def fetch_past_weather(city: str, start: str, end: str) -> Dict[str, Any]:
+    """WorldWeatherOnline past weather between two dates, concurrent calls for the same city share one request"""
+    key = " ".join(city.lower().split())
+
+    async def fetch():
+        api_key = os.getenv("WORLD_WEATHER_ONLINE_API")
+        url = f"{WWO_API_URL}?key={api_key}&q={city}&date={start}&enddate={end}&format=json"
+        response = await http_client.get(url, timeout=upstream_timeout(WWO_API_TIMEOUT))
+        response.raise_for_status()
+        res = response.json()
+        if "weather" in (res.get("data") or {}):      # WWO reports unknown cities etc. with a 200
+            past_weather_fallback.set(key, res)
+        return res
+
+    try:
+        return await wwo_flights.do((key, start, end), fetch)
+    except httpx.HTTPError:
+        res = past_weather_fallback.get(key)
+        if res is None:
+            raise
+        return res
+
+
+async def pest_alert_api(state: AdvisoryState, days=7):
     """
-    Fetches and parses weather data for pest risk analysis
-    Returns structured data for last 7 days, or None on error
+    Fetches the last 7 days of weather and scores pest risk with the local rule engine (alert_rules)
+    Returns {"pest_alert_level", "primary_risk_factors", "recommended_actions"}, or None on error
     """
     city = None
     if state.get("user_location"):
         city = state["user_location"]
     else:
-        # fallback: try to get from DB if needed
-        user = farmers.find_one({'_id': state["user_number"]})
-        city = user.get("city") if user else None
+        # fallback: profile loaded once for the request
+        city = (await state_profile(state)).get("city") or ""
 
     if not city.strip():
-        updated_api_data = dict(state["api_data"])
-        updated_api_data["pest_alert"] = "Please set your city, just type in 'city' and your city name."
-        return {"api_data": updated_api_data}
+        return {"api_data": {"pest_alert": "Please set your city, just type in 'city' and your city name."}}
         # return {"error": "City not provided"}
     
     api_key = os.getenv("WORLD_WEATHER_ONLINE_API")
@@ -244,327 +505,108 @@ def pest_alert_api(state: AdvisoryState, days=7):
 
     end_date = datetime.now()
     start_date = end_date - timedelta(days=days-1)
-    url = f"https://api.worldweatheronline.com/premium/v1/past-weather.ashx?key={api_key}&q={city}&date={start_date.strftime('%Y-%m-%d')}&enddate={end_date.strftime('%Y-%m-%d')}&format=json"
     
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        weather_data = response.json()
-    except requests.exceptions.RequestException:
+        weather_data = await fetch_past_weather(city, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))
+    except (httpx.HTTPError, ValueError):
         return None
 
     if not weather_data or "data" not in weather_data or "weather" not in weather_data["data"]:
         return None
 
-    parsed_data = []
-    for day in weather_data["data"]["weather"]:
-        # Basic daily metrics
-        date = day["date"]
-        max_temp = float(day["maxtempC"])
-        min_temp = float(day["mintempC"])
-        avg_temp = float(day["avgtempC"])
-        
-        hourly = day["hourly"]
-        precip_mm = sum(float(h["precipMM"]) for h in hourly)
-        humidities = [float(h["humidity"]) for h in hourly]
-        avg_humidity = sum(humidities) / len(humidities) if humidities else 0
-        wind_speeds = [float(h["windspeedKmph"]) for h in hourly]
-        max_wind = max(wind_speeds) if wind_speeds else 0
-        rain_hours = sum(1 for h in hourly if float(h["precipMM"]) > 0)
-        high_humidity_hours = sum(1 for h in hourly if float(h["humidity"]) > 70)
-
-        parsed_data.append({
-            "date": date,
-            "max_temp_c": max_temp,
-            "min_temp_c": min_temp,
-            "avg_temp_c": avg_temp,
-            "total_precip_mm": precip_mm,
-            "avg_humidity": avg_humidity,
-            "max_wind_kph": max_wind,
-            "rain_hours": rain_hours,
-            "high_humidity_hours": high_humidity_hours
-        })
+    try:
+        pest_alert = alert_rules.evaluate_pest_risk(alert_rules.pest_features_from_wwo(weather_data))
+    except (KeyError, ValueError) as e:
+        print(f"API Error: {e}")
+        return {"api_data": {"pest_alert": {"error": "Prediction failed"}}}
+
+    # the level is decided locally, the LLM is only asked to phrase actions when there is a risk
+    level = pest_alert["pest_alert_level"]
+    pest_alert["recommended_actions"] = []
+    if level != "none":
+        pest_alert["recommended_actions"] = await pest_actions(pest_alert) or alert_rules.DEFAULT_PEST_ACTIONS[level]
+    return {"api_data": {"pest_alert": pest_alert}}
 
-    weather_str = json.dumps(parsed_data, indent=2)
 
+PEST_ACTIONS_LLM = os.getenv("PEST_ACTIONS_LLM", "1") == "1"
+
+async def pest_actions(pest_alert: Dict[str, Any]) -> List[str]:
+    """
+    Short, crop-agnostic actions for the detected pest risk, empty list when the LLM is off or fails.
+    The prompt has no city, so cities with the same risk share one (cached) LLM call.
+    """
+    if not PEST_ACTIONS_LLM:
+        return []
     prompt = f"""
-                Analyze this weather data for pest risk in crops:
-                {weather_str}
-
-                Consider:
-                **Temperature Analysis:**
-                1. Check if daily average temperature falls in 20-30°C range (ideal for pest activity)
-                2. Identify consecutive days with optimal temperatures (accelerates pest reproduction)
-                3. Note temperature fluctuations >5°C/day (stresses crops, increases vulnerability)
-
-                **Humidity Analysis:**
-                4. Days with average humidity >70% (promotes fungal growth)
-                5. Hours with humidity >80% (high risk for disease development)
-                6. Consecutive high-humidity days (compounding disease risk)
-
-                **Precipitation Analysis:**
-                7. Days with >5mm rainfall (creates pest breeding sites)
-                8. >3 consecutive rainy days (sustained breeding conditions)
-                9. Rainy hours during warm periods (ideal for pest emergence)
-
-                **Wind Analysis:**
-                10. Days with max wind >15km/h (spreads pests/spores)
-                11. Windy days following rainy periods (disperses water-borne pathogens)
-
-                **Temporal Patterns:**
-                12. 3+ consecutive days with:
-                    - Temp 20-30°C + humidity >70%
-                    - Temp 20-30°C + rain >2mm
-                13. Increasing humidity trend over 48 hours
-                14. Temperature-humidity co-occurrence during crop flowering stage
-
-                **Threshold Triggers:**
-                15. Immediate alert if:
-                    - Day with >8 rainy hours + temp >25°C
-                    - 2+ days with humidity >85%
-                    - Day with >10mm rain + avg temp >22°C
-                16. Moderate alert if:
-                    - 3+ days with 4+ high-humidity hours
-                    - Steady temp 24-28°C with intermittent rain
-
-                **Output Requirements:**
-                - Return valid JSON format(nothing else): 
-                {{
-                "pest_alert_level": "none|low|medium|high",
-                "primary_risk_factors": ["list", "of", "top", "factors"],
-                "recommended_actions": ["action1", "action2"]
-                }}
-                
-            """
-    
-    invoke_url = "https://integrate.api.nvidia.com/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {os.environ['NVIDIA_API_KEY']}",
-        "Accept": "application/json"
-    }
-    
-    payload = {
-        "model": "meta/llama-4-scout-17b-16e-instruct",
-        "messages": [{"role": "user", "content": prompt}],
-        "max_tokens": 512,
-        "temperature": 0.7,       #more deterministic output
-        "top_p": 0.9,
-        "response_format": {"type": "json_object"}  # Ensure JSON output
-    }
+                Pest risk level over the last 7 days: {pest_alert["pest_alert_level"]}
+                Risk factors: {json.dumps(pest_alert["primary_risk_factors"])}
 
+                Suggest 2-4 short, practical actions a farmer should take now.
+                Return valid JSON format(nothing else): {{"recommended_actions": ["action1", "action2"]}}
+            """
     try:
-        response = requests.post(invoke_url, headers=headers, json=payload, timeout=40)
-        response.raise_for_status()
-        result = response.json()
-        
-        # Extract JSON content from response
-        content = result['choices'][0]['message']['content']
-        pest_alert = json.loads(content)
-        # state["api_data"]["pest_alert"] = pest_alert
-        
-        # return {"api_data": {"pest_alert": pest_alert}}
-
-        updated_api_data = dict(state["api_data"])
-        updated_api_data["pest_alert"] = pest_alert
-        return {"api_data": updated_api_data}
-        
-    except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
+        content = await chat_completion(prompt, max_tokens=256, call_site="pest_actions")
+        actions = json.loads(content).get("recommended_actions")
+        return [str(action) for action in actions] if isinstance(actions, list) else []
+    except (httpx.HTTPError, json.JSONDecodeError, KeyError, AttributeError) as e:
         print(f"API Error: {e}")
-        return {"error": "Prediction failed"}
+        return []
     
 
-def weather_alert_api(state:AdvisoryState, days=2):
+async def weather_alert_api(state:AdvisoryState, days=2):
+    """
+    Checks the next 48 hourly forecasts against the severe weather thresholds (alert_rules)
+    Returns {"weather_alert_level", "immediate_risks", "time_bound_actions"}, or None on error
+    """
     city = None
     if state.get("user_input") and state["user_input"].get("location"):
         city = state["user_input"]["location"]
     elif state.get("user_location"):
         city = state["user_location"]
     else:
-        # fallback: try to get from DB if needed
-        user = farmers.find_one({'_id': state["user_number"]})
-        city = user.get("city") if user else None
+        # fallback: profile loaded once for the request
+        city = (await state_profile(state)).get("city") or ""
 
     if not city.strip():
-        updated_api_data = dict(state["api_data"])
-        updated_api_data["weather_alert"] = "Please set your city, just type in 'city' and your city name."
-        return {"api_data": updated_api_data}
+        return {"api_data": {"weather_alert": "Please set your city, just type in 'city' and your city name."}}
         # return {"error": "City not provided"}
     
-    api_key = os.getenv("WEATHER_API_KEY")
-    if not api_key:
+    if not os.getenv("WEATHER_API_KEY"):
         print("Error: WEATHER_API_KEY environment variable not set")
         return None
 
-    url = f"http://api.weatherapi.com/v1/forecast.json?key={api_key}&q={city}&days={days}&aqi=no&alerts=yes"
-    
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        res = response.json()
-    except requests.exceptions.RequestException as e:
+        res = await fetch_weather_forecast(city, days)
+    except (httpx.HTTPError, ValueError) as e:
         print(f"API Error: {e}")
         return None
 
-    # Parse location
-    location_data = res.get('location', {})
-    location = {
-        'city': location_data.get('name', ''),
-        'region': location_data.get('region', ''),
-        'country': location_data.get('country', ''),
-        'localtime': location_data.get('localtime', '')
-    }
-
-    # Parse current weather
-    current_data = res.get('current', {})
-    current_weather = {
-        'temp_c': current_data.get('temp_c'),
-        'condition': current_data.get('condition', {}).get('text', ''),
-        'humidity': current_data.get('humidity'),
-        'precip_mm': current_data.get('precip_mm'),
-        'wind_kph': current_data.get('wind_kph'),
-        'feelslike_c': current_data.get('feelslike_c'),
-        'uv': current_data.get('uv')
-    }
-
-    # Parse daily forecast
-    forecast_days = []
-    for day in res.get('forecast', {}).get('forecastday', []):
-        day_info = day.get('day', {})
-        forecast_days.append({
-            'date': day.get('date', ''),
-            'max_temp_c': day_info.get('maxtemp_c'),
-            'min_temp_c': day_info.get('mintemp_c'),
-            'avg_temp_c': day_info.get('avgtemp_c'),
-            'total_precip_mm': day_info.get('totalprecip_mm'),
-            'condition': day_info.get('condition', {}).get('text', ''),
-            'chance_of_rain': day_info.get('daily_chance_of_rain'),
-            'uv': day_info.get('uv')
-        })
-
-    # Parse hourly forecast
-    hourly_forecast = []
-    for day in res.get('forecast', {}).get('forecastday', []):
-        for hour in day.get('hour', []):
-            hourly_forecast.append({
-                'time': hour.get('time', ''),
-                'temp_c': hour.get('temp_c'),
-                'condition': hour.get('condition', {}).get('text', ''),
-                'humidity': hour.get('humidity'),
-                'precip_mm': hour.get('precip_mm'),
-                'wind_kph': hour.get('wind_kph'),
-                'chance_of_rain': hour.get('chance_of_rain'),
-                'feelslike_c': hour.get('feelslike_c'),
-                'uv': hour.get('uv')
-            })
-
-    # Parse alerts
-    alerts = [alert.get('headline', '') for alert in res.get('alerts', {}).get('alert', [])]
-
-    weather_str =  {
-        'location': location,
-        'current_weather': current_weather,
-        'daily_forecast': forecast_days,
-        'hourly_forecast': hourly_forecast,
-        'alerts': alerts
-    }
-
-    prompt = f"""
-            **Role**: Agricultural Weather Alert Analyst
-            **Task**: Analyze hourly forecast for severe weather risks and generate alerts
-
-            **Hourly Weather Data**:
-            {weather_str}
-
-            **Critical Alert Thresholds**:
-            1. **Heavy Rain**:
-            - >10mm/h → Flood risk
-            - >20mm in 3h → Field inundation
-            - >8 rainy hours/day → Saturated soil
-
-            2. **Wind Damage**:
-            - Sustained >30km/h → Crop lodging
-            - Gusts >45km/h → Physical damage
-
-            3. **Temperature Extremes**:
-            - >40°C → Heat stress
-            - <5°C → Frost risk (for sensitive crops)
-
-            4. **Humidity Risks**:
-            - >90% for 6+ consecutive hours → Fungal explosion
-            - <30% + high winds → Desiccation
-
-            5. **Compound Risks**:
-            - Rain + wind → Erosion
-            - High temp + high humidity → Heat index >45°C
-
-            **Output Requirements**:
-            - Return **strictly as JSON**:
-            {{
-            "weather_alert_level": "none|low|medium|high",
-            "immediate_risks": ["top_3_risks"],
-            "time_bound_actions": [
-                "time_window": "0-6h", "action": "step1",
-                "time_window": "6-24h", "action": "step2"
-            ]
-            }}
-            - Prioritize risks occurring within next 12h
-            - Recommend time-bound actions for farmers
-            - Use 24-hour clock (IST) in responses
-            - Never include explanations or markdown
-            """
-    
-    invoke_url = "https://integrate.api.nvidia.com/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {os.environ['NVIDIA_API_KEY']}",
-        "Accept": "application/json"
-    }
-
-    payload = {
-        "model": "meta/llama-4-scout-17b-16e-instruct",
-        "messages": [{"role": "user", "content": prompt}],
-        "max_tokens": 512,
-        "temperature": 0.7,
-        "top_p": 0.9,
-        "response_format": {"type": "json_object"}
-    }
-
+    # thresholds are applied locally on the hourly series, no LLM round trip
     try:
-        response = requests.post(invoke_url, headers=headers, json=payload, timeout=40)
-        response.raise_for_status()
-        result = response.json()
-        
-        # Extract JSON content from response
-        content = result['choices'][0]['message']['content']
-        # Parse the JSON content and add to state["api_data"]["weather_alert"]
-        weather_alert = json.loads(content)
-        # state["api_data"]["weather_alert"] = weather_alert
-        
-        # return {"api_data": {"weather_alert": weather_alert}}
-        updated_api_data = dict(state["api_data"])
-        updated_api_data["weather_alert"] =weather_alert
-        return {"api_data": updated_api_data}
-        
-    except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
+        weather_alert = alert_rules.evaluate_weather_risk(alert_rules.weather_features_from_forecast(res))
+    except (KeyError, ValueError, TypeError) as e:
         print(f"API Error: {e}")
-        return {"error": "Prediction failed"}
+        return {"api_data": {"weather_alert": {"error": "Prediction failed"}}}
+    return {"api_data": {"weather_alert": weather_alert}}
 
 
-async def advisory(state: AdvisoryState):
+async def advisory(state: AdvisoryState, config: RunnableConfig):
     """
     Generates detailed LLM-powered advisories for user requests,
-    passes through preformatted alerts for scheduled runs
+    passes through preformatted alerts for scheduled runs.
+    With configurable stream_tokens the LLM tokens are emitted on the custom stream as {"token": ...}
     """
     city = None
     commodity = None
     
+    user = await state_profile(state)
     if state.get("user_location") and state.get("user_commodities"):
         city = state["user_location"]
         commodity = state.get("user_commodities")
     else:
-        # fallback: try to get from DB if needed
-        user = farmers.find_one({'_id': state["user_number"]})
-        city = user.get("city") if user else None
-        commodity = user.get("commodities") if user else None
+        # fallback: profile loaded once for the request
+        city = user.get("city") or ""
+        commodity = user.get("commodities")
 
     if (not city.strip()) or (not commodity):
         advice = "Please set your city(if not set) and what agricultural commodities you have(if not set), just type in 'city' and your city name or 'commodities' and your commodities seperated by ','."
@@ -575,14 +617,18 @@ async def advisory(state: AdvisoryState):
         # Extract data for user advisory
         weather = state["api_data"].get("weather")
         market = state["api_data"].get("market")
+        commodity_names = commodity if isinstance(commodity, list) else [str(commodity)]
         
         prompt = f"""
         **Role**: Agricultural Advisory Expert
         **Task**: Create comprehensive farming advice for {city} ({commodity}), give answer in first person
 
         **Input Data**:
-        Weather data: {weather},
-        Market data: {market}
+        Weather data:
+{prompt_format.weather_table(weather)}
+
+        Market data (e-NAM, rows for {", ".join(commodity_names)}):
+{prompt_format.market_table(market, commodity_names)}
 
         **Output Requirements**:
         1. **Structure**:
@@ -620,38 +666,22 @@ async def advisory(state: AdvisoryState):
         """
         
         
-        invoke_url = "https://integrate.api.nvidia.com/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {os.environ['NVIDIA_API_KEY']}",
-            "Accept": "application/json"
-        }
-        
-        payload = {
-            "model": "meta/llama-4-scout-17b-16e-instruct",
-            "messages": [{"role": "user", "content": prompt}],
-            "max_tokens": 512,
-            "temperature": 0.7,        # more deterministic output
-            "top_p": 0.9,
-            "response_format": {"type": "json_object"}  # Ensure JSON output
-        }
-
         try:
-            response = requests.post(invoke_url, headers=headers, json=payload, timeout=40)
-            response.raise_for_status()
-            result = response.json()
-            
-            # Extract JSON content from response
-            content = result['choices'][0]['message']['content']
+            on_token = None
+            if config.get("configurable", {}).get("stream_tokens"):
+                writer = get_stream_writer()
+                on_token = lambda token: writer({"token": token})
+            content = await chat_completion(prompt, call_site="advisory", on_token=on_token)
             advisory_text = json.loads(content)
             
-        except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
+        except (httpx.HTTPError, json.JSONDecodeError, KeyError) as e:
             print(f"API Error: {e}")
             advisory_text = {"error": "Prediction failed"}
 
         # state["advice"] = [advisory_text]
 
         formatted_text = ""
-        desired_language = user.get("last_message_language")
+        desired_language = translation_language(user.get("last_message_language"))
         if (desired_language=="en"):
             for key, value in advisory_text.items():
                 if isinstance(value, str):
@@ -701,59 +731,270 @@ async def advisory(state: AdvisoryState):
 #     else:
 #         return (f"Error: {response.status_code} - {response.text}"), ""
 
+# One long-lived translator, so its HTTP session is reused across requests
+translator = Translator(timeout=upstream_timeout(TRANSLATE_TIMEOUT))
+
+# Scheduled alert text and canned replies repeat a lot, translations are cached per (text hash, dest language)
+TRANSLATION_CACHE_TTL = float(os.getenv("TRANSLATION_CACHE_TTL", "86400"))
+translation_cache = TTLCache("translations", ttl=TRANSLATION_CACHE_TTL, maxsize=int(os.getenv("TRANSLATION_CACHE_SIZE", "4096")))
+
+# Optional LibreTranslate-compatible endpoint (POST {q, source, target} -> {translatedText,
+# detectedLanguage}), e.g. a self-hosted instance or the benchmark stub, used instead of googletrans
+TRANSLATE_URL = os.getenv("TRANSLATE_URL")
+translate_breaker = upstream_breaker("translate", TRANSLATE_URL)
+
+@app.on_event("shutdown")
+async def close_translator():
+    await translator.client.aclose()
+
+def translation_language(code) -> str:
+    """
+    The destination language as a googletrans language code, "en" when it is missing or unknown
+    (the command LLM stores null for last_message_language when the user names no language)
+    """
+    if isinstance(code, str):
+        code = code.strip().lower().split("_", 1)[0]
+        code = LANGCODES.get(code, code)
+        if code in LANGUAGES:
+            return code
+    return "en"
+
+async def translate_text(text, desired_language: str) -> tuple:
+    """(translated_text, detected_source_language) from TRANSLATE_URL or googletrans"""
+    if TRANSLATE_URL:
+        # like googletrans, non-string input (the graph passes its whole state) is sent as str()
+        query = text if isinstance(text, str) else str(text)
+        response = await http_client.post(TRANSLATE_URL, json={"q": query, "source": "auto", "target": desired_language, "format": "text"},
+                                          timeout=upstream_timeout(TRANSLATE_TIMEOUT))
+        response.raise_for_status()
+        res = response.json()
+        return res["translatedText"], res.get("detectedLanguage", {}).get("language", "en")
+
+    started = time.perf_counter()
+    try:
+        with tracing.span("googletrans.translate", dest=desired_language):
+            # googletrans has its own HTTP client, so its breaker wraps the call, only upstream errors count
+            translation = await translate_breaker.call(lambda: googletrans_translate(text, desired_language), failures=(httpx.HTTPError,))
+    except httpx.HTTPStatusError as e:
+        metrics.observe_upstream("googletrans", time.perf_counter() - started, e.response.status_code)
+        raise
+    except Exception:
+        metrics.observe_upstream("googletrans", time.perf_counter() - started, "error")
+        raise
+    metrics.observe_upstream("googletrans", time.perf_counter() - started, 200)
+    return translation.text, translation.src
+
+async def googletrans_translate(text, desired_language: str):
+    """
+    translator.translate, raising httpx.HTTPStatusError on non-200 responses: googletrans
+    itself then returns the original text tagged as English, which must not be cached
+    """
+    translation = await translator.translate(text, dest=desired_language)
+    response = getattr(translation, "_response", None)      # googletrans keeps the raw response there
+    if response is not None and response.status_code != 200:
+        raise httpx.HTTPStatusError(f"Google Translate returned {response.status_code}", request=response.request, response=response)
+    return translation
+
 async def multilingual_output(text, desired_language="en"):
     """
-    Asynchronously translate text to the desired language using py-googletrans.
+    Asynchronously translate text to the desired language using py-googletrans (or TRANSLATE_URL).
     Returns: {"advice": [translated_text], "language": detected_source_lang}
     """
+    desired_language = translation_language(desired_language)
     try:
-        async with Translator() as translator:
-            translation = await translator.translate(text, dest=desired_language)
-            translated_text = translation.text
-            # Remove non-alphanumeric chars only from start and end
-            clean_text = translated_text.strip(string.punctuation + string.whitespace)
-            detected_language = translation.src  # Detected source language
-            return {"advice": [clean_text], "language": detected_language}
+        key = None
+        if isinstance(text, str):
+            key = (hashlib.sha256(text.encode("utf-8")).hexdigest(), desired_language)
+            cached = translation_cache.get(key)
+            if cached is not None:
+                clean_text, detected_language = cached
+                return {"advice": [clean_text], "language": detected_language}
+
+        translated_text, detected_language = await translate_text(text, desired_language)
+        # Remove non-alphanumeric chars only from start and end
+        clean_text = translated_text.strip(string.punctuation + string.whitespace)
+        if key is not None:
+            translation_cache.set(key, (clean_text, detected_language))
+        return {"advice": [clean_text], "language": detected_language}
+    except httpx.HTTPError:
+        # translation is failing (or its breaker is open), the untranslated text beats an error message
+        original = text if isinstance(text, str) else str(text)
+        return {"advice": [original.strip(string.punctuation + string.whitespace)], "language": desired_language}
     except Exception as e:
         return {"advice": [f"Error: {str(e)}"], "language": desired_language}
 
 
 
-def fetch_all_users():
-    """Retrieve all users from MongoDB"""
-    return list(farmers.find({}))
+async def fetch_all_users():
+    """Stream all users from MongoDB"""
+    async for batch in database.farmer_batches():
+        for user in batch:
+            yield user
 
 
-def invoke_nvidia_llm(prompt: str) -> dict:
-    invoke_url = "https://integrate.api.nvidia.com/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {NVIDIA_API_KEY}",
-        "Accept": "application/json"
+NVIDIA_INVOKE_URL = os.getenv("NVIDIA_INVOKE_URL", "https://integrate.api.nvidia.com/v1/chat/completions")
+NVIDIA_MODEL = "meta/llama-4-scout-17b-16e-instruct"
+nvidia_breaker = upstream_breaker("nvidia", NVIDIA_INVOKE_URL)
+
+# Chat-completion responses are cached by a hash of (model, prompt, sampling params).
+# The in-process tier is always on, LLM_CACHE_MONGO=1 adds a Mongo tier shared by all instances.
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
+LLM_CACHE_MONGO = os.getenv("LLM_CACHE_MONGO", "0") == "1"
+llm_cache = TTLCache("llm_responses", ttl=LLM_CACHE_TTL, maxsize=int(os.getenv("LLM_CACHE_SIZE", "1024")))
+llm_cache_savings = {"llm_seconds_saved": 0.0, "llm_tokens_saved": 0}
+llm_flights = SingleFlight("nvidia")
+
+# Input tokens per call site (usage.prompt_tokens), prompt size drives time-to-first-token
+llm_prompt_tokens: Dict[str, Dict[str, int]] = {}
+
+def record_prompt_tokens(call_site: str, tokens: int):
+    site = llm_prompt_tokens.setdefault(call_site, {"calls": 0, "prompt_tokens": 0, "max_prompt_tokens": 0})
+    site["calls"] += 1
+    site["prompt_tokens"] += tokens
+    site["max_prompt_tokens"] = max(site["max_prompt_tokens"], tokens)
+
+def prompt_token_stats() -> Dict[str, Dict[str, Any]]:
+    return {
+        call_site: {**site, "avg_prompt_tokens": round(site["prompt_tokens"] / site["calls"], 1)}
+        for call_site, site in llm_prompt_tokens.items()
     }
-    
+
+@app.on_event("startup")
+async def create_llm_cache_index():
+    if LLM_CACHE_MONGO:
+        await database.ensure_llm_cache_index(int(LLM_CACHE_TTL))
+
+def llm_cache_key(payload: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+async def _cached_llm_entry(key: str) -> Optional[Dict[str, Any]]:
+    entry = llm_cache.get(key)
+    if entry is None and LLM_CACHE_MONGO:
+        try:
+            entry = await database.find_llm_cache_entry(key, datetime.utcnow() - timedelta(seconds=LLM_CACHE_TTL))
+        except PyMongoError as e:
+            # the Mongo tier is optional, a failing lookup is a miss
+            print(f"LLM cache lookup failed: {e}")
+            return None
+        if entry is not None:
+            llm_cache.set(key, entry)
+    return entry
+
+async def chat_completion(prompt: str, max_tokens: int = 512, temperature: float = 0.7,
+                          top_p: float = 0.9, json_output: bool = True, cache: bool = True,
+                          call_site: str = "other", on_token: Optional[Callable[[str], Any]] = None) -> str:
+    """
+    Calls NVIDIA chat completions and returns the message content.
+    cache=False opts a call site out of the response cache, call_site labels the input token stats.
+    on_token switches to a streamed completion and is called with every content delta
+    (once with the whole content on a cache hit).
+    Raises httpx.HTTPError / KeyError on failed calls.
+    """
     payload = {
-        "model": "meta/llama-4-scout-17b-16e-instruct",
+        "model": NVIDIA_MODEL,
         "messages": [{"role": "user", "content": prompt}],
-        "max_tokens": 512,
-        "temperature": 0.7,
-        "top_p": 0.9,
-        "response_format": {"type": "json_object"}
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "top_p": top_p
     }
-
-    try:
-        response = requests.post(invoke_url, headers=headers, json=payload, timeout=40)
+    if json_output:
+        payload["response_format"] = {"type": "json_object"}  # Ensure JSON output
+
+    key = llm_cache_key(payload) if cache else None
+    if cache:
+        entry = await _cached_llm_entry(key)
+        if entry is not None:
+            llm_cache_savings["llm_seconds_saved"] += entry["elapsed"]
+            llm_cache_savings["llm_tokens_saved"] += entry["total_tokens"]
+            if on_token is not None:
+                on_token(entry["content"])
+            return entry["content"]
+
+    if cache and on_token is None:
+        # identical prompts in flight at the same time (e.g. same alerts, same city) share one call
+        return await llm_flights.do(key, lambda: _chat_completion_call(payload, key, prompt, call_site, cache, json_output, on_token))
+    return await _chat_completion_call(payload, key, prompt, call_site, cache, json_output, on_token)
+
+
+async def _chat_completion_call(payload: Dict[str, Any], key: Optional[str], prompt: str, call_site: str,
+                                cache: bool, json_output: bool, on_token) -> str:
+    headers = {
+        "Authorization": f"Bearer {NVIDIA_API_KEY}",
+        "Accept": "application/json"
+    }
+    started = time.perf_counter()
+    if on_token is not None:
+        content, usage = await _stream_chat_completion(payload, headers, on_token)
+    else:
+        response = await http_client.post(NVIDIA_INVOKE_URL, headers=headers, json=payload, timeout=upstream_timeout(LLM_TIMEOUT))
         response.raise_for_status()
         result = response.json()
-        
-        # Extract and parse JSON content
         content = result['choices'][0]['message']['content']
+        usage = result.get("usage") or {}
+    prompt_tokens = usage.get("prompt_tokens") or prompt_format.estimate_tokens(prompt)
+    record_prompt_tokens(call_site, prompt_tokens)
+    metrics.LLM_TOKENS.labels(call_site, "prompt").inc(prompt_tokens)
+    metrics.LLM_TOKENS.labels(call_site, "completion").inc(usage.get("completion_tokens") or 0)
+
+    if cache:
+        try:
+            if json_output:
+                json.loads(content)         # never cache a malformed answer
+        except json.JSONDecodeError:
+            return content
+        entry = {
+            "_id": key,
+            "content": content,
+            "elapsed": time.perf_counter() - started,
+            "total_tokens": usage.get("total_tokens", 0),
+            "created_at": datetime.utcnow()
+        }
+        llm_cache.set(key, entry)
+        if LLM_CACHE_MONGO:
+            try:
+                await database.save_llm_cache_entry(entry)
+            except PyMongoError as e:
+                # the answer is still returned and kept in the in-process tier
+                print(f"LLM cache save failed: {e}")
+    return content
+
+
+async def _stream_chat_completion(payload: Dict[str, Any], headers: Dict[str, str], on_token) -> tuple:
+    """Streams a chat completion (SSE), returns (content, usage) once the stream is done"""
+    payload = {**payload, "stream": True, "stream_options": {"include_usage": True}}
+    headers = {**headers, "Accept": "text/event-stream"}
+    parts, usage = [], {}
+    # LLM_TIMEOUT bounds the wait for the first and between tokens, not the whole stream
+    async with http_client.stream("POST", NVIDIA_INVOKE_URL, headers=headers, json=payload, timeout=upstream_timeout(LLM_TIMEOUT)) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            usage = chunk.get("usage") or usage
+            for choice in chunk.get("choices") or []:
+                delta = (choice.get("delta") or {}).get("content")
+                if delta:
+                    parts.append(delta)
+                    on_token(delta)
+    if not parts:
+        raise KeyError("choices")
+    return "".join(parts), usage
+
+
+async def invoke_nvidia_llm(prompt: str, call_site: str = "other") -> dict:
+    try:
+        content = await chat_completion(prompt, call_site=call_site)
         return json.loads(content)
-    except (requests.exceptions.RequestException, json.JSONDecodeError, KeyError) as e:
+    except (httpx.HTTPError, json.JSONDecodeError, KeyError) as e:
         print(f"API Error: {e}")
         return {"error": "LLM processing failed"}
 
 
-def llm_command_generator(english_input: str, phone: str) -> Dict[str, Any]:
+async def llm_command_generator(english_input: str, phone: str) -> Dict[str, Any]:
     """Generates DB commands using NVIDIA API"""
     prompt = f"""
     Convert this user command into JSON for MongoDB operations:(if command does not require MongoDB database update, set operation as none)
@@ -778,77 +1019,73 @@ def llm_command_generator(english_input: str, phone: str) -> Dict[str, Any]:
     - if state is set, always capitalize it, for example WEST BENGAL, HARYANA, ODISHA ...
     - Keep arrays empty if no items
     """
-    return invoke_nvidia_llm(prompt)
+    return await invoke_nvidia_llm(prompt, call_site="command")
 
-def execute_mongodb_command(command: Dict[str, Any], phone, received_msg_lang):
+async def execute_mongodb_command(command: Dict[str, Any], phone, received_msg_lang):
+    """Applies the generated command to the farmer's document, returns the updated profile (None once deleted)"""
     if "error" in command:
         raise ValueError(f"Invalid command: {command['error']}")
     
     # phone = command['_id']
 
-    if not farmers.find_one({'_id': phone}):
-        # Insert a new document with only _id and empty fields
-        farmers.insert_one({
-            '_id': phone,
-            'name': '',
-            'city': '',
-            'state': '',
-            'commodities': [],
-            'last_message_language': received_msg_lang
-        }) 
+    operation = command['operation']
+    if operation == 'delete':
+        await database.delete_farmer(phone)
+        profile_cache.delete(phone)
+        return None
+
+    # Field updates
+    set_fields = {}
+    add_items, remove_items = [], []
+    if operation in ('insert', 'update'):
+        set_fields = {k: v for k in ['name', 'city', 'state'] if (v := command.get(k)) is not None}
 
-    
-    if command['operation'] == 'insert':
-        document = {
-            '_id': phone,
-            'name': command.get('name', ''),
-            'city': command.get('city', ''),
-            'state': command.get('state', ''),
-            'commodities': command.get('commodities', {}).get('add', []),
-            'last_message_language': received_msg_lang
-        }
-        farmers.insert_one(document)
-    
-    elif command['operation'] == 'update':
-        # Field updates
-        update_data = {k: v for k in ['name', 'city', 'state'] if (v := command.get(k)) is not None}
-        
         #language update
-        if 'last_message_language' in command:
-            update_data["last_message_language"] = command.get("last_message_language", "en")
-        
+        if operation == 'insert':
+            set_fields["last_message_language"] = received_msg_lang
+        elif 'last_message_language' in command:
+            set_fields["last_message_language"] = command.get("last_message_language", "en")
+
         # Commodity operations
-        if 'commodities' in command:
-            if add_items := command['commodities'].get('add'):
-                farmers.update_one(
-                    {'_id': phone},
-                    {'$addToSet': {'commodities': {'$each': add_items}}}
-                )
-            if remove_items := command['commodities'].get('remove'):
-                farmers.update_one(
-                    {'_id': phone},
-                    {'$pull': {'commodities': {'$in': remove_items}}}
-                )
-        
-        # Update other fields
-        if update_data:
-            farmers.update_one({'_id': phone}, {'$set': update_data})
-    
-    elif command['operation'] == 'delete':
-        farmers.delete_one({'_id': phone})
+        commodities = command.get('commodities') or {}
+        add_items = commodities.get('add') or []
+        remove_items = commodities.get('remove') or []
+
+    # One atomic upsert: a missing document is created with empty fields, then the
+    # field sets and commodity add/remove are applied and the new document is returned
+    profile = await database.upsert_farmer(phone, set_fields, add_items, remove_items, default_language=received_msg_lang)
 
-    elif command['operation'] == 'none':
-        pass
+    # write-through, so the rest of the request reads the updated profile from profile_cache
+    profile_cache.set(phone, profile)
+    return profile
+
+intent_stats = {"fast_path": 0, "llm_fallback": 0}
+
+def intent_parser_stats() -> Dict[str, Any]:
+    parsed = intent_stats["fast_path"] + intent_stats["llm_fallback"]
+    return {**intent_stats, "hit_ratio": round(intent_stats["fast_path"] / parsed, 4) if parsed else 0.0}
 
 async def process_user_request(user_input: str, phone: str, language: str = "en"):
     """end to end, request processing"""
-    translation_result = await multilingual_output(user_input)
+    with tracing.span("multilingual_output"):
+        translation_result = await multilingual_output(user_input)
     english_input = translation_result["advice"][0]
     received_message_language = translation_result["language"]
     
-    command = llm_command_generator(english_input, phone)
+    # common commands and greetings are parsed locally, the LLM only sees the rest
+    command = intent_parser.parse_command(english_input, phone)
+    if command is not None:
+        intent_stats["fast_path"] += 1
+    else:
+        intent_stats["llm_fallback"] += 1
+        with tracing.span("llm_command_generator"):
+            command = await llm_command_generator(english_input, phone)
+        if "error" in command:
+            # LLM failing or its breaker open: the profile stays as it is, the advisory is still served
+            return {"status": "degraded", "operation": "none", "error": command["error"]}
     
-    execute_mongodb_command(command, phone, received_msg_lang=received_message_language)
+    with tracing.span("execute_mongodb_command", operation=command.get("operation")):
+        await execute_mongodb_command(command, phone, received_msg_lang=received_message_language)
     return {"status": "success", "operation": command.get('operation')}
 
 
@@ -868,38 +1105,39 @@ def db_operation_node(state: AdvisoryState):
 
 builder = StateGraph(AdvisoryState)
 
-builder.add_node("weather_api_node", weather_data_api)
-builder.add_node("market_api_node", market_price_api)
-builder.add_node("pest_alert_node", pest_alert_api)
-builder.add_node("weather_alert_node", weather_alert_api)
+def instrumented_node(name: str, fn):
+    """Node with a latency histogram (/metrics) and a span (tracing)"""
+    return metrics.timed_node(name, tracing.traced(name)(fn))
+
+
+builder.add_node("weather_api_node", instrumented_node("weather_api_node", weather_data_api))
+builder.add_node("market_api_node", instrumented_node("market_api_node", market_price_api))
+builder.add_node("pest_alert_node", instrumented_node("pest_alert_node", pest_alert_api))
+builder.add_node("weather_alert_node", instrumented_node("weather_alert_node", weather_alert_api))
 # builder.add_node("alert_api_node", weather_alert_api)
-builder.add_node("advisory_node", advisory)
-builder.add_node("multilingual_output_node", multilingual_output)
+builder.add_node("advisory_node", instrumented_node("advisory_node", advisory))
+builder.add_node("multilingual_output_node", instrumented_node("multilingual_output_node", multilingual_output))
 
-# Conditional routing after weather_api_node
-def route_after_weather(state: AdvisoryState) -> str:
+# Fan out from START: the two fetch nodes of each path are independent,
+# so they run in the same step and api_data is merged by merge_api_data
+def route_from_start(state: AdvisoryState) -> List[str]:
     if (state["workflow_type"] == "user"):
-        return "weather_api_node"
+        return ["weather_api_node", "market_api_node"]
     else:
-        return "pest_alert_node"
+        return ["pest_alert_node", "weather_alert_node"]
 
 builder.add_conditional_edges(
     START,
-    route_after_weather,
-    {
-        "weather_api_node": "weather_api_node",
-        "pest_alert_node": "pest_alert_node"
-    }
+    route_from_start,
+    ["weather_api_node", "market_api_node", "pest_alert_node", "weather_alert_node"]
 )
 
-# user advisory path
-builder.add_edge("weather_api_node", "market_api_node")
-builder.add_edge("market_api_node", "advisory_node")
+# user advisory path (joins on both fetches)
+builder.add_edge(["weather_api_node", "market_api_node"], "advisory_node")
 builder.add_edge("advisory_node", "multilingual_output_node")
 
-# scheduled run path
-builder.add_edge("pest_alert_node", "weather_alert_node")
-builder.add_edge("weather_alert_node", "multilingual_output_node")
+# scheduled run path (joins on both alerts)
+builder.add_edge(["pest_alert_node", "weather_alert_node"], "multilingual_output_node")
 
 # Common output
 builder.add_edge("multilingual_output_node", END)
@@ -909,8 +1147,8 @@ graph = builder.compile()
 
 
 
-def send_whatsapp_message(phone: str, message: str):
-    """Send message via WhatsApp API"""
+async def send_whatsapp_message(phone: str, message: str):
+    """Send message via WhatsApp API, raises httpx.HTTPError on failure"""
     url = "https://graph.facebook.com/v22.0/746570235196802/messages"  # Your WhatsApp number ID
     headers = {
         "Authorization": f"Bearer {os.environ['WHATSAPP_API_TOKEN']}",
@@ -923,82 +1161,316 @@ def send_whatsapp_message(phone: str, message: str):
         "type": "text",
         "text": {"body": message}
     }
-    requests.post(url, headers=headers, json=payload)
+    response = await http_client.post(url, headers=headers, json=payload)
+    response.raise_for_status()
 
 
 
-def send_sms_message(phone: str, message: str):
+async def send_sms_message(phone: str, message: str):
     """
-    Send an SMS via Twilio API.
+    Send an SMS via Twilio API (shared async client).
     """
-    # Load credentials from environment variables
-    account_sid = os.getenv("TWILIO_ACCOUNT_SID")
-    auth_token = os.getenv("TWILIO_AUTH_TOKEN")
-    from_number = os.getenv("TWILIO_PHONE_NUMBER")  # Your Twilio number
-
-    if not all([account_sid, auth_token, from_number]):
+    if not all([TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_PHONE_NUMBER]):
         raise ValueError("Twilio credentials are not set in environment variables.")
 
-    client = Client(account_sid, auth_token)
-    msg = client.messages.create(
+    msg = await twilio_client.messages.create_async(
         body="This is a sample response for your pest/weather ALERT",        #message,
-        from_=from_number,
+        from_=TWILIO_PHONE_NUMBER,
         to=phone
     )
     # print(f"Twilio SMS sent: SID={msg.sid}, Body={msg.body}")
     return msg.sid
 
 
+def is_transient_delivery_error(e: Exception) -> bool:
+    """Rate limits, provider 5xx and network errors are worth a retry, bad numbers are not"""
+    if isinstance(e, TwilioRestException):
+        return e.status == 429 or e.status >= 500
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code == 429 or e.response.status_code >= 500
+    return isinstance(e, (httpx.TransportError, aiohttp.ClientError, asyncio.TimeoutError))
+
+# Outbound queues, rates are messages per second (0 = unlimited) to match the provider quotas
+DISPATCH_WORKERS = int(os.getenv("DISPATCH_WORKERS", "8"))
+DISPATCH_MAX_RETRIES = int(os.getenv("DISPATCH_MAX_RETRIES", "3"))
+sms_dispatcher = Dispatcher(
+    "sms", send_sms_message, rate=float(os.getenv("SMS_RATE_PER_SECOND", "10")),
+    workers=DISPATCH_WORKERS, max_retries=DISPATCH_MAX_RETRIES, is_transient=is_transient_delivery_error
+)
+whatsapp_dispatcher = Dispatcher(
+    "whatsapp", send_whatsapp_message, rate=float(os.getenv("WHATSAPP_RATE_PER_SECOND", "20")),
+    workers=DISPATCH_WORKERS, max_retries=DISPATCH_MAX_RETRIES, is_transient=is_transient_delivery_error
+)
+
+@app.on_event("startup")
+async def create_twilio_client():
+    global twilio_client
+    twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, http_client=AsyncTwilioHttpClient(timeout=HTTP_READ_TIMEOUT))
+
+@app.on_event("shutdown")
+async def close_dispatchers():
+    await sms_dispatcher.close()
+    await whatsapp_dispatcher.close()
+    if twilio_client is not None:
+        await twilio_client.http_client.close()
+
+
 async def summarize_alerts_and_notify(state, pest_alert, weather_alert, lang="en"):
     prompt = f"""
                 You are an agricultural advisory assistant. Summarize the following pest and weather alerts for a farmer in a clear, actionable, and concise WhatsApp message. Use bullet points, emojis, and simple language. If both alerts are 'none', say 'No urgent alerts today.'
 
                 ---
                 Pest Alert:
-                {json.dumps(pest_alert, indent=2)}
+                {prompt_format.alert_lines(pest_alert)}
 
                 Weather Alert:
-                {json.dumps(weather_alert, indent=2)}
+                {prompt_format.alert_lines(weather_alert)}
                 ---
 
                 Format:
                 - summarize the risks and recommended actions for each (pest first, then weather).
                 - Return only the summary message as a JSON object: {{"alert_message": "..."}}
             """
-    invoke_url = "https://integrate.api.nvidia.com/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {os.environ['NVIDIA_API_KEY']}",
-        "Accept": "application/json"
-    }
-    payload = {
-        "model": "meta/llama-4-scout-17b-16e-instruct",
-        "messages": [{"role": "user", "content": prompt}],
-        "max_tokens": 512,
-        "temperature": 0.7,
-        "top_p": 0.9,
-        "response_format": {"type": "json_object"}
-    }
     try:
-        response = requests.post(invoke_url, headers=headers, json=payload, timeout=40)
-        response.raise_for_status()
-        result = response.json()
-        content = result['choices'][0]['message']['content']
+        content = await chat_completion(prompt, call_site="alert_summary")
         advisory = json.loads(content)
         alert_message = advisory.get('alert_message', '')
-        # Optionally translate
-        # if user_desired_language != "en":
-        alert_message_final = await multilingual_output(alert_message, lang)
+    except (httpx.HTTPError, json.JSONDecodeError, KeyError, AttributeError) as e:
+        # LLM failing or its breaker open: the farmer still gets the alerts, unformatted
+        print(f"API Error: {e}")
+        alert_message = plain_alert_message(pest_alert, weather_alert)
 
-        # state["alert_message"] = alert_message_final
-        # return state
-        return alert_message_final.get("advice", [""])[0]  # Extract first string from advice list
-    
+    # Optionally translate
+    # if user_desired_language != "en":
+    alert_message_final = await multilingual_output(alert_message, lang)
+
+    # state["alert_message"] = alert_message_final
+    # return state
+    return alert_message_final.get("advice", [""])[0]  # Extract first string from advice list
+
+def plain_alert_message(pest_alert, weather_alert) -> str:
+    """Alert summary built without the LLM, pest first, then weather"""
+    return f"Pest Alert:\n{prompt_format.alert_lines(pest_alert)}\n\nWeather Alert:\n{prompt_format.alert_lines(weather_alert)}"
 
-    except (requests.exceptions.RequestException, json.JSONDecodeError, KeyError) as e:
-        print(f"API Error: {e}")
-        return "Prediction failed"
 
 
+#--------------------------------------------SCHEDULED RUN ENGINE-------------------------------------------------------------------------------
+
+SCHEDULED_RUN_CONCURRENCY = int(os.getenv("SCHEDULED_RUN_CONCURRENCY", "10"))
+
+def alert_level(alert, level_key: str) -> str:
+    """Alert level of a pest/weather alert, raw strings (e.g. 'set your city') are used as is"""
+    if isinstance(alert, dict):
+        return str(alert.get(level_key) or "none").lower()
+    if isinstance(alert, str):
+        return alert.lower()
+    return "none"
+
+SET_CITY_MESSAGE = "Please set your city, just type in 'city' and your city name."
+
+def city_key(city: Optional[str]) -> str:
+    """Normalized city (trimmed, lower case, single spaces) used to group users"""
+    return " ".join((city or "").lower().split())
+
+def group_by_city(users: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    groups: Dict[str, Dict[str, Any]] = {}
+    for user in users:
+        key = city_key(user.get("city"))
+        groups.setdefault(key, {"_id": key, "members": []})["members"].append(user)
+    return list(groups.values())
+
+async def _memoized(memo: Dict[Any, asyncio.Future], key, make):
+    """Runs make() once per key for the whole scheduled run, concurrent callers share the result"""
+    task = memo.get(key)
+    if task is None:
+        task = memo[key] = asyncio.ensure_future(make())
+    return await task
+
+async def city_alert_data(city: str, language: str):
+    """Runs the scheduled graph once for a city, returns (state, pest_alert, weather_alert)"""
+    state = AdvisoryState(
+        workflow_type="scheduled_run",
+        user_number="",
+        user_input=None,
+        api_data={},
+        advice=[],
+        alert_message="",
+        emergency_flag=True,
+        language=language,
+        user_location=city
+    )
+    result = await graph.ainvoke(state)
+
+    # Fetch alert levels from both pest and weather alert
+    return state, result["api_data"].get("pest_alert", {}), result["api_data"].get("weather_alert", {})
+
+def alert_signature(pest_alert, weather_alert) -> str:
+    """
+    Hash of the deterministic alert fields (levels, risk factors, weather risks and actions),
+    cities with identical alerts share one summary. The LLM-phrased pest actions are left out.
+    """
+    if isinstance(pest_alert, dict):
+        pest_alert = {key: value for key, value in pest_alert.items() if key != "recommended_actions"}
+    payload = json.dumps([pest_alert, weather_alert], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+async def build_city_alerts(group: Dict[str, Any], memo: Dict[Any, asyncio.Future]) -> List[tuple]:
+    """
+    Fans the alerts of a city group out to its members. Within one run the pest/weather
+    analysis runs once per city and the summary/translation step once per distinct
+    (pest_alert, weather_alert, language), no matter how many cities or batches share it.
+    Returns a list of (member, message) for the members that should be notified.
+    """
+    city, members = group["_id"], group["members"]
+    if not city:
+        return [(member, SET_CITY_MESSAGE) for member in members]
+
+    state, pest_alert, weather_alert = await _memoized(
+        memo, ("alerts", city), lambda: city_alert_data(city, members[0].get("last_message_language") or "en")
+    )
+
+    if isinstance(pest_alert, str) and isinstance(weather_alert, str):         # if both alerts are raw strings
+        return [(member, SET_CITY_MESSAGE) for member in members]
+    if alert_level(pest_alert, "pest_alert_level") == "none" and alert_level(weather_alert, "weather_alert_level") == "none":
+        return []
+
+    signature = alert_signature(pest_alert, weather_alert)
+    languages = sorted({member.get("last_message_language") or "en" for member in members})
+    summaries = await asyncio.gather(*(
+        _memoized(memo, ("summary", signature, lang), lambda lang=lang: summarize_alerts_and_notify(state, pest_alert, weather_alert, lang))
+        for lang in languages
+    ))
+    by_language = dict(zip(languages, summaries))
+    return [(member, by_language[member.get("last_message_language") or "en"]) for member in members]
+
+_active_runs: set = set()      # run ids of the scheduled runs going on in this process
+
+async def run_scheduled_batch(run_name: str, deliver, concurrency: Optional[int] = None, resume: bool = False,
+                              on_progress=None, run_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Streams users in _id order, groups every batch by city and builds the alerts with a
+    bounded pool of workers, handing each (member, message) to deliver. A failing group
+    or delivery is recorded and the rest of the run keeps going.
+    After each batch the last _id is checkpointed per (run_name, run_id), so overlapping runs
+    keep their own position. A run started again with the same run_id (a picked up job)
+    resumes right after it, resume=True continues the latest interrupted run of run_name.
+    Delivery is at-least-once: a run interrupted mid-batch re-sends that whole batch on resume.
+    on_progress is awaited with the counts after every batch.
+    Returns aggregate counts and throughput of the run.
+    """
+    concurrency = max(1, concurrency or SCHEDULED_RUN_CONCURRENCY)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    stats = {"checked_batches": 0, "checked_users": 0, "processed_users": 0, "failed_users": 0}
+    errors = []
+    memo: Dict[Any, asyncio.Future] = {}
+    processed_counter = metrics.SCHEDULED_USERS.labels(run_name, "processed")
+    failed_counter = metrics.SCHEDULED_USERS.labels(run_name, "failed")
+
+    run_id = run_id or uuid.uuid4().hex
+    checkpoint = await database.load_checkpoint(run_name, run_id)
+    if not (checkpoint and checkpoint.get("status") == "running") and resume:
+        checkpoint = await database.take_over_checkpoint(run_name, run_id, sorted(_active_runs))
+    resumed_from = checkpoint.get("last_id") if checkpoint else None
+    await database.save_checkpoint(run_name, run_id, status="running", last_id=resumed_from)
+    _active_runs.add(run_id)
+
+    async def process_group(group):
+        stats["checked_users"] += len(group["members"])
+        try:
+            alerts = await build_city_alerts(group, memo)
+        except Exception as e:
+            stats["failed_users"] += len(group["members"])
+            failed_counter.inc(len(group["members"]))
+            errors.append({"city": group["_id"], "error": str(e)})
+            print(f"Scheduled run error for city {group['_id']!r}: {e}")
+            return
+        # deliveries of a group are queued together, the dispatcher paces and parallelizes them
+        results = await asyncio.gather(*(deliver(member, message) for member, message in alerts), return_exceptions=True)
+        for (member, _), result in zip(alerts, results):
+            if isinstance(result, BaseException):
+                stats["failed_users"] += 1
+                failed_counter.inc()
+                errors.append({"user": member["_id"], "error": str(result)})
+                print(f"Scheduled run error for {member['_id']}: {result}")
+            else:
+                stats["processed_users"] += 1
+                processed_counter.inc()
+
+    async def worker():
+        while True:
+            group = await queue.get()
+            try:
+                if group is None:
+                    return
+                await process_group(group)
+            finally:
+                queue.task_done()
+
+    started = time.perf_counter()
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        async for batch in database.farmer_batches(after_id=resumed_from):
+            for group in group_by_city(batch):
+                await queue.put(group)
+            # the whole batch is done before its last _id is checkpointed
+            await queue.join()
+            await database.save_checkpoint(run_name, run_id, last_id=batch[-1]["_id"])
+            stats["checked_batches"] += 1
+            if on_progress is not None:
+                await on_progress(dict(stats))
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        _active_runs.discard(run_id)
+        for task in workers:
+            task.cancel()
+    await database.save_checkpoint(run_name, run_id, status="completed")
+    elapsed = time.perf_counter() - started
+    metrics.SCHEDULED_RUN_SECONDS.labels(run_name).set(elapsed)
+    metrics.SCHEDULED_RUN_USERS_PER_SECOND.labels(run_name).set(stats["checked_users"] / elapsed if elapsed > 0 else 0.0)
+
+    return {
+        **stats,
+        "distinct_cities": sum(1 for key in memo if key[0] == "alerts"),
+        "distinct_summaries": sum(1 for key in memo if key[0] == "summary"),
+        "resumed_from": resumed_from,
+        "errors": errors,
+        "concurrency": concurrency,
+        "elapsed_seconds": round(elapsed, 3),
+        "users_per_second": round(stats["checked_users"] / elapsed, 3) if elapsed > 0 else 0.0
+    }
+
+
+metrics.register_stats("cache", lambda: {
+    cache.name: cache.stats() for cache in (weather_cache, past_weather_fallback, market_cache, llm_cache, translation_cache, profile_cache)
+})
+metrics.register_stats("llm_cache", lambda: {"llm_responses": llm_cache_savings})
+metrics.register_stats("single_flight", lambda: {
+    flights.name: flights.stats() for flights in (weather_flights, wwo_flights, market_flights, llm_flights)
+})
+metrics.register_stats("circuit_breaker", lambda: {name: breaker.stats() for name, breaker in circuit_breakers.items()})
+metrics.register_stats("intent_parser", lambda: {"commands": intent_parser_stats()})
+metrics.register_stats("dispatcher", lambda: {d.name: d.stats() for d in (sms_dispatcher, whatsapp_dispatcher)})
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus metrics: node and upstream latency, upstream status codes, LLM tokens, caches, scheduled runs"""
+    content, content_type = metrics.render()
+    return Response(content=content, media_type=content_type)
+
+
+@app.get("/cache-stats")
+async def cache_stats():
+    """Hit/miss counters of the in-process caches, plus LLM input tokens per call site, the intent parser fast path and circuit breaker states"""
+    stats = {cache.name: cache.stats() for cache in (weather_cache, past_weather_fallback, market_cache, llm_cache, translation_cache, profile_cache)}
+    stats[llm_cache.name].update({k: round(v, 3) for k, v in llm_cache_savings.items()})
+    stats[llm_cache.name]["prompt_tokens"] = prompt_token_stats()
+    stats["intent_parser"] = intent_parser_stats()
+    stats["single_flight"] = {flights.name: flights.stats() for flights in (weather_flights, wwo_flights, market_flights, llm_flights)}
+    stats["circuit_breakers"] = {name: breaker.stats() for name, breaker in circuit_breakers.items()}
+    return stats
+
 
 VERIFY_TOKEN = os.getenv("WEBHOOK_VERIFY_TOKEN", "my_secret_token")
 # Specifying api endpoints
@@ -1017,6 +1489,7 @@ async def verify_webhook(request: Request):
     return Response(content="Verification failed", status_code=status.HTTP_403_FORBIDDEN)
 
 @app.post("/whatsapp-webhook")
+@tracing.traced_endpoint("whatsapp-webhook")
 async def whatsapp_webhook(request: Request):
     """Handle incoming WhatsApp messages"""
     data = await request.json()
@@ -1034,19 +1507,21 @@ async def whatsapp_webhook(request: Request):
         api_data={},
         advice=[],
         alert_message="",
-        emergency_flag=False
+        emergency_flag=False,
+        profile=await get_farmer_profile(str(phone))
     )
     advisory_state = await graph.ainvoke(state)
     
     # Send response
-    # send_whatsapp_message(phone, advisory_state["advice"][0] if advisory_state["advice"] else "")   #advisory_state["advice"])
-    send_sms_message(phone, advisory_state["advice"][0] if advisory_state["advice"] else "")
+    # await whatsapp_dispatcher.deliver(phone, advisory_state["advice"][0] if advisory_state["advice"] else "")   #advisory_state["advice"])
+    await sms_dispatcher.deliver(phone, advisory_state["advice"][0] if advisory_state["advice"] else "")
     return {"status": "success", "db_operations": result}
 
 
 #--------------------------------------------ENDPOINTS FOR MOCKUP WEBPAGE-------------------------------------------------------------------
 
 @app.post("/mockup-webhook")
+@tracing.traced_endpoint("mockup-webhook")
 async def mockup_webhook(request: Request):
     """
     Response for the mockup site (POST).
@@ -1074,7 +1549,8 @@ async def mockup_webhook(request: Request):
         advice=[],
         alert_message="",
         emergency_flag=False,
-        language="en"
+        language="en",
+        profile=await get_farmer_profile(str(phone))
     )
     # advisory_state = graph.invoke(state)
     advisory_state = await graph.ainvoke(state)
@@ -1092,123 +1568,148 @@ async def mockup_webhook(request: Request):
         "db_operations": result
     }
 
-@app.get("/mockup-scheduled-run")
-async def mockup_scheduled_run():
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+@app.post("/mockup-webhook-stream")
+async def mockup_webhook_stream(request: Request):
     """
-    Simulate scheduled alerts, show what messages would be sent to which numbers(present in db).
-    No real sms or WhatsApp is sent.
+    Streaming variant of /mockup-webhook (server-sent events).
+    Expects JSON body: { "phone": "...", "message": "..." }
+    Events: "stage" after the DB command and after every graph node, "token" for every
+    advisory LLM token, then "advice" with the same body /mockup-webhook returns, or "error".
     """
-    users = farmers.find({})
-    processed = 0
-    sent_messages = []  # Collect all "sent" messages here
+    data = await request.json()
+    phone = data.get("phone")
+    message = data.get("message")
 
-    for user in users:
-        state = AdvisoryState(
-            workflow_type="scheduled_run",
-            user_number=user["_id"],
-            user_input=None,
-            api_data={},
-            advice=[],
-            alert_message="",
-            emergency_flag=True,
-            language=user.get("last_message_language", "en")
+    if not phone or not message:
+        return JSONResponse(
+            status_code=400,
+            content={"error": "Missing 'phone' or 'message' in request body"}
         )
-        result = await graph.ainvoke({
-            **state,
-            "user_location": user.get("city"),
-            "user_commodities": user.get("commodities"),
-            "user_state": user.get("state")
-        })
 
-        pest_alert = result["api_data"].get("pest_alert", {})
-        weather_alert = result["api_data"].get("weather_alert", {})
+    async def events():
+        try:
+            result = await process_user_request(message, phone)
+            yield sse_event("stage", {"stage": "db_operations", "db_operations": result})
+
+            state = AdvisoryState(
+                workflow_type="user",
+                user_input=message,
+                user_number=str(phone),
+                api_data={},
+                advice=[],
+                alert_message="",
+                emergency_flag=False,
+                language="en",
+                profile=await get_farmer_profile(str(phone))
+            )
+            advice = []
+            async for mode, chunk in graph.astream(state, config={"configurable": {"stream_tokens": True}},
+                                                   stream_mode=["updates", "custom"]):
+                if mode == "custom":
+                    yield sse_event("token", {"text": chunk.get("token", "")})
+                    continue
+                for node, update in chunk.items():
+                    if isinstance(update, dict) and update.get("advice"):
+                        advice = update["advice"]
+                    yield sse_event("stage", {"stage": node})
+
+            advice_text = advice[0] if isinstance(advice, list) and advice else advice or ""
+            yield sse_event("advice", {"advice": advice_text, "db_operations": result})
+        except Exception as e:
+            print(f"API Error: {e}")
+            yield sse_event("error", {"error": str(e)})
 
-        if isinstance(pest_alert, dict):
-            pest_level = pest_alert.get("pest_alert_level", "none").lower()
-        elif isinstance(pest_alert, str):
-            pest_level = pest_alert.lower()
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
-        if isinstance(weather_alert, dict):
-            weather_level = weather_alert.get("weather_alert_level", "none").lower()
-        elif isinstance(weather_alert, str):
-            weather_level = weather_alert.lower()
-        
+@app.get("/mockup-scheduled-run")
+async def mockup_scheduled_run(concurrency: Optional[int] = None, resume: bool = False):
+    """
+    Simulate scheduled alerts, show what messages would be sent to which numbers(present in db).
+    No real sms or WhatsApp is sent.
+    """
+    sent_messages = []  # Collect all "sent" messages here
 
-        if isinstance(pest_alert, str) and isinstance(weather_alert, str):
-            message = "Please set your city, just type in 'city' and your city name."
-            sent_messages.append({
-                "to": user["_id"],
-                "message": message
-            })
-            processed += 1
-        elif pest_level != "none" or weather_level != "none":
-            state_with_alert_message = await summarize_alerts_and_notify(
-                state, pest_alert, weather_alert, user.get("last_message_language", "en")
-            )
-            sent_messages.append({
-                "to": user["_id"],
-                "message": state_with_alert_message
-            })
-            processed += 1
+    async def collect(member, message):
+        sent_messages.append({
+            "to": member["_id"],
+            "message": message
+        })
 
+    stats = await run_scheduled_batch("mockup-scheduled-run", collect, concurrency, resume)
     return {
-        "processed_users": processed,
+        **stats,
         "messages": sent_messages
     }
 
 
 #------------------------------------------------------------------------------------------------------------------------------------------------
 
-@app.get("/scheduled-run")
-async def scheduled_run():
-    """Trigger scheduled alerts"""
-    users = farmers.find({})
-    processed = 0
-    for user in users:
-        state = AdvisoryState(
-            workflow_type="scheduled_run",
-            user_number= user["_id"],
-            user_input=None,
-            api_data={},
-            advice=[],
-            alert_message="",
-            emergency_flag=True,
-            language= user["last_message_language"]
-        )
-        result = await graph.ainvoke({
-            **state,
-            "user_location": user["city"],
-            "user_commodities": user["commodities"],
-            "user_state": user["state"]
-        })
+@jobs.register("scheduled-run")
+async def scheduled_run_job(job: Dict[str, Any], report_progress) -> Dict[str, Any]:
+    """Background job of /scheduled-run, the checkpoint is tied to the job, so a picked up orphan resumes from it"""
+    async def notify(member, message):
+        # await whatsapp_dispatcher.deliver(member["_id"], message)
+        await sms_dispatcher.deliver(member["_id"], message)
 
-        # Fetch alert levels from both pest and weather alert
-        pest_alert = result["api_data"].get("pest_alert", {})
-        weather_alert = result["api_data"].get("weather_alert", {})
+    params = job["params"]
+    stats = await run_scheduled_batch("scheduled-run", notify, params.get("concurrency"), params.get("resume", False),
+                                      on_progress=report_progress, run_id=job["_id"])
+    stats["errors"] = stats["errors"][:100]
+    return stats
 
-        if isinstance(pest_alert, dict):
-            pest_level = pest_alert.get("pest_alert_level", "none").lower()
-        elif isinstance(pest_alert, str):
-            pest_level = pest_alert.lower()
+_job_watcher: Optional[asyncio.Task] = None
 
-        if isinstance(weather_alert, dict):
-            weather_level = weather_alert.get("weather_alert_level", "none").lower()
-        elif isinstance(weather_alert, str):
-            weather_level = weather_alert.lower()
-        
-        
-        if isinstance(pest_alert, str) and isinstance(weather_alert, str):         # if both alerts are raw strings
-            message = "Please set your city, just type in 'city' and your city name."
-            # send_whatsapp_message(user["_id"], message)
-            send_sms_message(user["_id"], message)
-            processed += 1
-        elif pest_level != "none" or weather_level != "none":
-            state_with_alert_message = summarize_alerts_and_notify(state, pest_alert, weather_alert, user["last_message_language"])#result["language"])
-            # send_whatsapp_message(user["_id"], state_with_alert_message)
-            send_sms_message(user["_id"], state_with_alert_message)
-            processed += 1
-
-    return {"processed_users": processed}
+@app.on_event("startup")
+async def start_job_watcher():
+    global _job_watcher
+    _job_watcher = asyncio.create_task(jobs.watch_orphans())
+
+@app.on_event("shutdown")
+async def stop_jobs():
+    await jobs.shutdown()
+
+@app.get("/scheduled-run")
+async def scheduled_run(concurrency: Optional[int] = None, resume: bool = False):
+    """Trigger scheduled alerts, the run happens in a background job"""
+    job = await jobs.enqueue("scheduled-run", {"concurrency": concurrency, "resume": resume})
+    return {"job_id": job["_id"], "status": job["status"], "progress_url": f"/jobs/{job['_id']}"}
+
+@app.get("/jobs/{job_id}")
+async def job_progress(job_id: str):
+    """Status, progress counts, remaining users and throughput of a background job"""
+    job = await database.find_job(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Job not found"})
+
+    progress = job.get("progress") or {}
+    remaining = 0
+    if job["status"] in ("queued", "running"):
+        checkpoint = await database.load_checkpoint(job["kind"], job["_id"])
+        remaining = await database.count_farmers(after_id=checkpoint.get("last_id") if checkpoint else None)
+
+    started_at, finished_at = job.get("started_at"), job.get("finished_at")
+    elapsed = ((finished_at or datetime.utcnow()) - started_at).total_seconds() if started_at else 0.0
+    return {
+        "job_id": job["_id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "owner": job.get("owner"),
+        "attempts": job.get("attempts", 1),
+        "processed_users": progress.get("processed_users", 0),
+        "failed_users": progress.get("failed_users", 0),
+        "checked_users": progress.get("checked_users", 0),
+        "remaining_users": remaining,
+        "elapsed_seconds": round(elapsed, 3),
+        "users_per_second": round(progress.get("checked_users", 0) / elapsed, 3) if elapsed > 0 else 0.0,
+        "created_at": job.get("created_at"),
+        "started_at": started_at,
+        "finished_at": finished_at,
+        "result": job.get("result"),
+        "error": job.get("error")
+    }
 
 
 
@@ -0,0 +1,110 @@
+import functools
+import time
+from typing import Any, Callable, Dict, Tuple
+
+import httpx
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import GaugeMetricFamily
+
+# Prometheus metrics served on /metrics. Hot-path instrumentation is limited to a
+# histogram observe/counter increment per node run and per upstream request; cache,
+# single-flight and dispatcher numbers are read from their stats() at scrape time.
+
+registry = CollectorRegistry()
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60)
+
+NODE_SECONDS = Histogram(
+    "annadata_graph_node_seconds", "Run time of a LangGraph node", ["node"],
+    buckets=LATENCY_BUCKETS, registry=registry
+)
+UPSTREAM_SECONDS = Histogram(
+    "annadata_upstream_request_seconds", "Time to response headers of outbound requests", ["upstream"],
+    buckets=LATENCY_BUCKETS, registry=registry
+)
+UPSTREAM_REQUESTS = Counter(
+    "annadata_upstream_requests", "Outbound requests by upstream and status code ('error' when no response)",
+    ["upstream", "status"], registry=registry
+)
+LLM_TOKENS = Counter(
+    "annadata_llm_tokens", "LLM tokens of uncached completions", ["call_site", "kind"], registry=registry
+)
+SCHEDULED_USERS = Counter(
+    "annadata_scheduled_users", "Users handled by scheduled runs", ["run", "outcome"], registry=registry
+)
+SCHEDULED_RUN_SECONDS = Gauge(
+    "annadata_scheduled_run_last_duration_seconds", "Duration of the last finished scheduled run", ["run"], registry=registry
+)
+SCHEDULED_RUN_USERS_PER_SECOND = Gauge(
+    "annadata_scheduled_run_last_users_per_second", "Throughput of the last finished scheduled run", ["run"], registry=registry
+)
+
+
+def timed_node(name: str, fn: Callable) -> Callable:
+    """Wraps an async graph node to record its run time, the signature is kept for LangGraph"""
+    histogram = NODE_SECONDS.labels(name)
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - started)
+    return wrapper
+
+
+def observe_upstream(upstream: str, seconds: float, status: Any) -> None:
+    UPSTREAM_SECONDS.labels(upstream).observe(seconds)
+    UPSTREAM_REQUESTS.labels(upstream, str(status)).inc()
+
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """httpx transport recording latency and status per upstream host around the wrapped transport"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except Exception:
+            observe_upstream(request.url.host, time.perf_counter() - started, "error")
+            raise
+        observe_upstream(request.url.host, time.perf_counter() - started, response.status_code)
+        return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class StatsCollector:
+    """
+    Exposes {label_value: {field: number}} dicts as gauges named annadata_<group>_<field>
+    with a <group> label, e.g. annadata_cache_hit_ratio{cache="llm_responses"}
+    """
+
+    def __init__(self, group: str, stats: Callable[[], Dict[str, Dict[str, Any]]]):
+        self.group = group
+        self.stats = stats
+
+    def collect(self):
+        families: Dict[str, GaugeMetricFamily] = {}
+        for label, fields in self.stats().items():
+            for field, value in fields.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"annadata_{self.group}_{field}"
+                if name not in families:
+                    families[name] = GaugeMetricFamily(name, f"{field} per {self.group}", labels=[self.group])
+                families[name].add_metric([label], value)
+        return list(families.values())
+
+
+def register_stats(group: str, stats: Callable[[], Dict[str, Dict[str, Any]]]) -> None:
+    registry.register(StatsCollector(group, stats))
+
+
+def render() -> Tuple[bytes, str]:
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,90 @@
+from typing import Any, Dict, Iterable, List, Optional
+
+# Compact encodings for the data interpolated into LLM prompts. A header line plus
+# one comma separated row per record costs far fewer input tokens than a Python/JSON
+# repr that repeats every key on every record.
+
+MARKET_COLUMNS = ["apmc", "commodity", "min_price", "modal_price", "max_price", "commodity_traded", "Commodity_Uom"]
+MARKET_HEADERS = ["apmc", "commodity", "min", "modal", "max", "traded", "unit"]
+MARKET_MAX_ROWS = 40
+
+WEATHER_FORECAST_COLUMNS = ["date", "min_temp_c", "max_temp_c", "avg_temp_c", "total_precip_mm", "chance_of_rain", "condition"]
+WEATHER_FORECAST_HEADERS = ["date", "min_c", "max_c", "avg_c", "rain_mm", "rain_pct", "condition"]
+
+
+def cell(value: Any) -> str:
+    """One table cell, commas and newlines would break the row so they are replaced"""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).replace(",", " ").replace("\n", " ").strip()
+
+
+def table(rows: Iterable[Dict[str, Any]], columns: List[str], headers: Optional[List[str]] = None) -> str:
+    """Rows as a header line plus comma separated values, only the given columns"""
+    lines = [",".join(headers or columns)]
+    lines.extend(",".join(cell(row.get(column)) for column in columns) for row in rows)
+    return "\n".join(lines)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) for when the API reports no usage"""
+    return (len(text) + 3) // 4
+
+
+def matches_commodity(name: str, commodities: Iterable[str]) -> bool:
+    name = name.lower()
+    return any(c.lower() in name or name in c.lower() for c in commodities if c)
+
+
+def market_table(market: Any, commodities: Optional[List[str]] = None, max_rows: int = MARKET_MAX_ROWS) -> str:
+    """
+    e-NAM snapshot ({"data": [...]}) as a compact table, restricted to the user's commodities.
+    Falls back to all rows when none of them is traded today, strings (e.g. 'set your state') pass through.
+    An older day's snapshot (snapshot_date set) is labelled with its date.
+    """
+    if isinstance(market, str):
+        return market
+    rows = (market or {}).get("data") if isinstance(market, dict) else None
+    if not rows:
+        return "no market data"
+    dated = f"prices of {market['snapshot_date']} (today's are not available yet):\n" if market.get("snapshot_date") else ""
+    if commodities:
+        wanted = [row for row in rows if matches_commodity(str(row.get("commodity", "")), commodities)]
+        if wanted:
+            rows = wanted
+        else:
+            return dated + f"none of {', '.join(commodities)} traded {'that day' if dated else 'today'}, other commodities:\n" + table(rows[:max_rows], MARKET_COLUMNS, MARKET_HEADERS)
+    return dated + table(rows[:max_rows], MARKET_COLUMNS, MARKET_HEADERS)
+
+
+def weather_table(weather: Any) -> str:
+    """Parsed weather_data_api output as a location/current line plus a daily forecast table"""
+    if not isinstance(weather, dict):
+        return str(weather) if weather else "no weather data"
+    location = weather.get("location", {})
+    current = weather.get("current_weather", {})
+    lines = [
+        f"location: {cell(location.get('city'))} {cell(location.get('region'))}, local time {cell(location.get('localtime'))}",
+        "now: " + " ".join(f"{key}={cell(value)}" for key, value in current.items() if value not in (None, "")),
+        table(weather.get("forecast", []), WEATHER_FORECAST_COLUMNS, WEATHER_FORECAST_HEADERS)
+    ]
+    if weather.get("alerts"):
+        lines.append("official alerts: " + "; ".join(cell(alert) for alert in weather["alerts"]))
+    return "\n".join(lines)
+
+
+def alert_lines(alert: Any) -> str:
+    """Pest/weather alert dict as 'key: value' lines, lists joined with ';'"""
+    if not isinstance(alert, dict):
+        return str(alert) if alert else "none"
+    lines = []
+    for key, value in alert.items():
+        if isinstance(value, list):
+            value = "; ".join(
+                " ".join(cell(v) for v in item.values()) if isinstance(item, dict) else cell(item)
+                for item in value
+            )
+        lines.append(f"{key}: {value}")
+    return "\n".join(lines)
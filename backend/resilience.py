@@ -0,0 +1,164 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Tuple, Type, TypeVar
+
+import httpx
+
+T = TypeVar("T")
+
+# Guards around the upstream fetchers (weatherapi, WorldWeatherOnline, e-NAM, NVIDIA).
+
+
+class SingleFlight:
+    """
+    Concurrent calls with the same key share one in-flight call: the first caller starts
+    fn(), later callers await the same result (or exception) instead of a second request.
+    A caller being cancelled does not cancel the shared call.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.coalesced = 0
+        self._flights: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        future = self._flights.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        self.calls += 1
+        future = asyncio.ensure_future(fn())
+        self._flights[key] = future
+
+        def done(f: asyncio.Future):
+            if self._flights.get(key) is f:
+                del self._flights[key]
+            if not f.cancelled():
+                f.exception()       # retrieved here, so an unawaited failure is not logged as lost
+        future.add_done_callback(done)
+        return await asyncio.shield(future)
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": len(self._flights)}
+
+
+class CircuitOpenError(httpx.TransportError):
+    """Raised instead of calling an upstream whose circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Closed: calls go through and consecutive failures are counted. After failure_threshold
+    of them the breaker opens and calls fail right away with CircuitOpenError. Once
+    reset_timeout seconds passed a single probe call is let through (half-open): a success
+    closes the breaker, a failure opens it for another reset_timeout.
+    """
+
+    STATE_CODES = {"closed": 0, "half_open": 1, "open": 2}
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opened = 0
+        self.rejected = 0
+        self._probing = False
+
+    def _before_call(self) -> None:
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.rejected += 1
+                raise CircuitOpenError(f"{self.name} circuit breaker is open")
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._probing:
+                self.rejected += 1
+                raise CircuitOpenError(f"{self.name} circuit breaker is half-open, probe in flight")
+            self._probing = True
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.opened += 1
+            print(f"{self.name} circuit breaker opened after {self.failures} failures")
+
+    async def call(self, fn: Callable[[], Awaitable[T]], is_failure: Callable[[T], bool] = lambda result: False,
+                   failures: Tuple[Type[BaseException], ...] = (Exception,)) -> T:
+        """
+        Runs fn() through the breaker. Exceptions of the failures types and results matching
+        is_failure count as failures, other exceptions (e.g. bad arguments) are passed through.
+        """
+        self._before_call()
+        try:
+            result = await fn()
+        except failures:
+            self.record_failure()
+            raise
+        except BaseException:
+            self._probing = False       # a cancelled probe or a caller error says nothing about the upstream
+            raise
+        if is_failure(result):
+            self.record_failure()
+        else:
+            self.record_success()
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "state_code": self.STATE_CODES[self.state],
+            "consecutive_failures": self.failures,
+            "failure_threshold": self.failure_threshold,
+            "reset_timeout_seconds": self.reset_timeout,
+            "opened": self.opened,
+            "rejected": self.rejected
+        }
+
+
+def is_server_error(response: httpx.Response) -> bool:
+    return response.status_code >= 500 or response.status_code == 429
+
+
+class CircuitBreakerTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport passing requests through the breaker registered for their URL prefix.
+    Connection errors, timeouts, 5xx and 429 responses count as failures, other responses as successes.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+        self.breakers: List[Tuple[str, CircuitBreaker]] = []
+
+    def guard(self, url_prefix: str, breaker: CircuitBreaker) -> CircuitBreaker:
+        self.breakers.append((url_prefix, breaker))
+        return breaker
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        url = str(request.url)
+        for url_prefix, breaker in self.breakers:
+            if url.startswith(url_prefix):
+                try:
+                    return await breaker.call(lambda: self.transport.handle_async_request(request), is_failure=is_server_error)
+                except CircuitOpenError as e:
+                    e.request = request
+                    raise
+        return await self.transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
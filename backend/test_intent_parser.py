@@ -0,0 +1,38 @@
+import intent_parser
+import main
+
+
+def apply(run, phone, message):
+    command = intent_parser.parse_command(message, phone)
+    assert command is not None, message
+    return run(main.execute_mongodb_command(command, phone, received_msg_lang="en"))
+
+
+def test_remove_matches_commodities_saved_with_another_casing(fake_db, run):
+    fake_db["Info"].insert_one({"_id": "919000000001", "name": "", "city": "Karnal", "state": "HARYANA",
+                                "commodities": ["onion", "wheat"], "last_message_language": "en"})
+    profile = apply(run, "919000000001", "remove onion")
+    assert profile["commodities"] == ["wheat"]
+
+
+def test_add_does_not_duplicate_another_casing(fake_db, run):
+    # saved through the LLM path, as typed
+    llm_command = {"operation": "update", "commodities": {"add": ["onion"], "remove": []}}
+    run(main.execute_mongodb_command(llm_command, "919000000002", received_msg_lang="en"))
+    profile = apply(run, "919000000002", "commodities ONION, Wheat and wheat")
+    assert profile["commodities"] == ["onion", "Wheat"]
+    profile = apply(run, "919000000002", "remove commodity WHEAT")
+    assert profile["commodities"] == ["onion"]
+
+
+def test_questions_are_left_to_the_llm():
+    for message in ("crop insurance", "crops in winter", "add fertilizer to wheat", "i live in a village",
+                    "i am from karnal haryana", "remove pests from wheat"):
+        assert intent_parser.parse_command(message, "919000000003") is None, message
+
+
+def test_profile_commands_are_parsed_locally():
+    command = intent_parser.parse_command("city Sri Ganganagar; state rajasthan\nadd onion and garlic", "919000000004")
+    assert command["city"] == "Sri Ganganagar"
+    assert command["state"] == "RAJASTHAN"
+    assert command["commodities"] == {"add": ["Onion", "Garlic"], "remove": []}
@@ -0,0 +1,52 @@
+import json
+
+import httpx
+import pytest
+from pymongo.errors import ServerSelectionTimeoutError
+
+import database
+import main
+
+ANSWER = json.dumps({"alert_message": "Delay spraying, rain expected"})
+
+
+@pytest.fixture
+def llm(monkeypatch, fake_db):
+    """NVIDIA answered by a mock transport, the Mongo cache tier on, returns the list of LLM requests"""
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json={"choices": [{"message": {"content": ANSWER}}],
+                                         "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}})
+
+    monkeypatch.setattr(main, "http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(main, "LLM_CACHE_MONGO", True)
+    main.llm_cache.clear()
+    yield requests
+    main.llm_cache.clear()
+
+
+def failing_mongo(*args, **kwargs):
+    raise ServerSelectionTimeoutError("mongo is down")
+
+
+def test_mongo_tier_serves_answers_of_other_instances(llm, run):
+    assert run(main.chat_completion("summarize", call_site="test")) == ANSWER
+    main.llm_cache.clear()          # another instance: only the Mongo tier has the answer
+    assert run(main.chat_completion("summarize", call_site="test")) == ANSWER
+    assert len(llm) == 1
+
+
+def test_failing_mongo_lookup_is_a_miss(llm, run, monkeypatch):
+    monkeypatch.setattr(database, "find_llm_cache_entry", failing_mongo)
+    assert run(main.chat_completion("summarize", call_site="test")) == ANSWER
+    assert len(llm) == 1
+
+
+def test_failing_mongo_save_still_returns_and_caches_the_answer(llm, run, monkeypatch):
+    monkeypatch.setattr(database, "find_llm_cache_entry", failing_mongo)
+    monkeypatch.setattr(database, "save_llm_cache_entry", failing_mongo)
+    assert run(main.chat_completion("summarize", call_site="test")) == ANSWER
+    assert run(main.chat_completion("summarize", call_site="test")) == ANSWER
+    assert len(llm) == 1            # the second call is served by the in-process tier
@@ -0,0 +1,30 @@
+import main
+import metrics
+
+
+def counted(run_name: str, outcome: str) -> float:
+    return metrics.registry.get_sample_value("annadata_scheduled_users_total", {"run": run_name, "outcome": outcome}) or 0.0
+
+
+def test_failure_counters_match_the_run_result(fake_db, run, monkeypatch):
+    fake_db["Info"].insert_many([
+        {"_id": "918100000001", "city": "Karnal", "state": "HARYANA", "commodities": ["Wheat"], "last_message_language": "en"},
+        {"_id": "918100000002", "city": "Karnal", "state": "HARYANA", "commodities": ["Wheat"], "last_message_language": "en"},
+        {"_id": "918100000003", "city": "", "state": "", "commodities": [], "last_message_language": "en"},
+        {"_id": "918100000004", "city": "", "state": "", "commodities": [], "last_message_language": "en"}
+    ])
+
+    async def city_fails(group, memo):
+        if group["_id"]:
+            raise RuntimeError("weather lookup failed")
+        return [(member, main.SET_CITY_MESSAGE) for member in group["members"]]
+    monkeypatch.setattr(main, "build_city_alerts", city_fails)
+
+    async def deliver(member, message):
+        if member["_id"] == "918100000004":
+            raise RuntimeError("SMS rejected")
+
+    stats = run(main.run_scheduled_batch("metrics-test", deliver))
+    assert (stats["processed_users"], stats["failed_users"]) == (1, 3)
+    assert counted("metrics-test", "processed") == stats["processed_users"]
+    assert counted("metrics-test", "failed") == stats["failed_users"]
@@ -0,0 +1,47 @@
+import database
+import main
+
+FARMERS = [{"_id": f"9180000000{i:02d}", "city": "", "state": "", "commodities": [], "last_message_language": "en"}
+           for i in range(10)]
+
+
+def seed(fake_db):
+    fake_db["Info"].insert_many([dict(farmer) for farmer in FARMERS])
+
+
+def collector():
+    sent = []
+
+    async def deliver(member, message):
+        sent.append(member["_id"])
+    return sent, deliver
+
+
+def test_new_run_ignores_checkpoint_of_another_run(fake_db, run):
+    seed(fake_db)
+    run(database.save_checkpoint("nightly", "yesterday", status="running", last_id=FARMERS[4]["_id"]))
+    sent, deliver = collector()
+    stats = run(main.run_scheduled_batch("nightly", deliver, run_id="today"))
+    assert stats["resumed_from"] is None
+    assert sent == [farmer["_id"] for farmer in FARMERS]
+
+
+def test_same_run_resumes_from_its_checkpoint(fake_db, run):
+    seed(fake_db)
+    run(database.save_checkpoint("nightly", "job-1", status="running", last_id=FARMERS[4]["_id"]))
+    sent, deliver = collector()
+    stats = run(main.run_scheduled_batch("nightly", deliver, run_id="job-1"))
+    assert stats["resumed_from"] == FARMERS[4]["_id"]
+    assert sent == [farmer["_id"] for farmer in FARMERS[5:]]
+
+
+def test_resume_takes_over_the_interrupted_run_once(fake_db, run):
+    seed(fake_db)
+    run(database.save_checkpoint("nightly", "crashed", status="running", last_id=FARMERS[6]["_id"]))
+    run(database.save_checkpoint("nightly", "done", status="completed", last_id=FARMERS[9]["_id"]))
+    sent, deliver = collector()
+    assert run(main.run_scheduled_batch("nightly", deliver, resume=True))["resumed_from"] == FARMERS[6]["_id"]
+    assert sent == [farmer["_id"] for farmer in FARMERS[7:]]
+    # the crashed run was continued, a second resume starts over
+    assert run(main.run_scheduled_batch("nightly", deliver, resume=True))["resumed_from"] is None
+    assert run(database.load_checkpoint("nightly", "crashed"))["status"] == "resumed"
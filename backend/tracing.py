@@ -0,0 +1,142 @@
+import functools
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+# Lightweight per-request tracing. A trace is started by a webhook when it is asked for
+# (X-Debug-Trace request header) or when TRACE_LOG_PATH is set; stages, graph nodes,
+# outbound HTTP requests and Mongo calls add spans to it. The current span lives in a
+# ContextVar, so spans opened in tasks spawned by LangGraph or asyncio.gather get the
+# right parent. Without an active trace span() costs a ContextVar lookup.
+
+TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH")
+DEBUG_HEADER = "X-Debug-Trace"
+
+_trace: ContextVar[Optional["Trace"]] = ContextVar("trace", default=None)
+_span_id: ContextVar[Optional[str]] = ContextVar("span_id", default=None)
+
+
+class Trace:
+    def __init__(self, name: str):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            "spans": sorted(self.spans, key=lambda span: span["start_ms"])
+        }
+
+
+def requested(headers) -> bool:
+    return TRACE_LOG_PATH is not None or headers.get(DEBUG_HEADER, "").lower() in ("1", "true", "yes")
+
+
+@contextmanager
+def trace(name: str, enabled: bool = True):
+    """Starts a trace for the current request, yields it (None when disabled) and logs it at the end"""
+    if not enabled:
+        yield None
+        return
+    current = Trace(name)
+    trace_token = _trace.set(current)
+    span_token = _span_id.set(None)
+    try:
+        yield current
+    finally:
+        _span_id.reset(span_token)
+        _trace.reset(trace_token)
+        if TRACE_LOG_PATH:
+            with open(TRACE_LOG_PATH, "a", encoding="utf-8") as log:
+                log.write(json.dumps(current.to_dict(), ensure_ascii=False, default=str) + "\n")
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Child span of the current span, a no-op outside of a trace"""
+    current = _trace.get()
+    if current is None:
+        yield None
+        return
+    record = {
+        "span_id": uuid.uuid4().hex[:16],
+        "parent_id": _span_id.get(),
+        "name": name,
+        "start_ms": round((time.perf_counter() - current.started) * 1000, 2),
+        "attributes": attributes
+    }
+    token = _span_id.set(record["span_id"])
+    started = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        _span_id.reset(token)
+        current.spans.append(record)
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """Decorator running an async function inside a span, the signature is kept (LangGraph nodes)"""
+    def decorator(fn: Callable) -> Callable:
+        span_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with span(span_name):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TracedTransport(httpx.AsyncBaseTransport):
+    """httpx transport adding an 'HTTP <method> <host>' span per outbound request"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        with span(f"HTTP {request.method} {request.url.host}", path=request.url.path) as record:
+            response = await self.transport.handle_async_request(request)
+            if record is not None:
+                record["attributes"]["status"] = response.status_code
+            return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+def traced_endpoint(name: str) -> Callable:
+    """
+    Decorator for FastAPI endpoints taking a `request`: traces the call when requested and,
+    for the debug header, returns the trace as JSON in X-Trace (plus its id in X-Trace-Id)
+    """
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            headers = kwargs["request"].headers
+            debug = headers.get(DEBUG_HEADER, "").lower() in ("1", "true", "yes")
+            with trace(name, enabled=requested(headers)) as current:
+                result = await fn(*args, **kwargs)
+                if current is not None and debug:
+                    if not isinstance(result, Response):
+                        result = JSONResponse(content=jsonable_encoder(result))
+                    result.headers["X-Trace-Id"] = current.trace_id
+                    result.headers["X-Trace"] = json.dumps(current.to_dict(), separators=(",", ":"), ensure_ascii=True, default=str)
+            return result
+        return wrapper
+    return decorator
@@ -1,5 +1,5 @@
 import React, { useState } from 'react';
-import axios from 'axios';
+import { streamAdvice, previewFromTokens, STAGE_LABELS } from '../src/streamAdvice';
 
 function MockupSMS() {
   const [phone, setPhone] = useState('');
@@ -7,17 +7,33 @@ function MockupSMS() {
   const [responses, setResponses] = useState([]);
   const [error, setError] = useState(null);
 
+  // updates the last conversation entry (the one being streamed)
+  const updateLast = (update) => {
+    setResponses(prev => [...prev.slice(0, -1), { ...prev[prev.length - 1], ...update(prev[prev.length - 1]) }]);
+  };
+
   const handleSend = async (e) => {
     e.preventDefault();
     setError(null);
+    setResponses(prev => [
+      ...prev,
+      { phone, message, response: null, partial: '', stage: 'Sending...' }
+    ]);
+    setMessage('');
     try {
-      const res = await axios.post('/mockup-webhook', { phone, message });
-      setResponses(prev => [
-        ...prev,
-        { phone, message, response: res.data }
-      ]);
-      setMessage('');
+      await streamAdvice('/mockup-webhook-stream', { phone, message }, (event, data) => {
+        if (event === 'stage') {
+          updateLast(() => ({ stage: STAGE_LABELS[data.stage] || data.stage }));
+        } else if (event === 'token') {
+          updateLast(entry => ({ partial: entry.partial + data.text }));
+        } else if (event === 'advice') {
+          updateLast(() => ({ response: data, stage: null }));
+        } else if (event === 'error') {
+          throw new Error(data.error);
+        }
+      });
     } catch (err) {
+      setResponses(prev => prev.filter(entry => entry.response !== null));
       setError(err.message || 'Error sending message');
     }
   };
@@ -82,9 +98,16 @@ function MockupSMS() {
                     <span className="inline-block bg-green-600 text-white px-3 py-1 rounded-full text-xs font-bold">Server</span>
                   </div>
                   <div className="bg-green-100 text-green-900 rounded-xl px-4 py-2 self-end max-w-xs shadow">
-                    {typeof entry.response === 'object'
-                      ? JSON.stringify(entry.response)
-                      : String(entry.response)}
+                    {entry.response === null
+                      ? (
+                        <span className="whitespace-pre-line">
+                          <span className="block text-xs text-gray-500 mb-1">{entry.stage}</span>
+                          {previewFromTokens(entry.partial)}
+                        </span>
+                      )
+                      : typeof entry.response === 'object'
+                        ? JSON.stringify(entry.response)
+                        : String(entry.response)}
                   </div>
                 </div>
               ))
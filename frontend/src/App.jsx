@@ -1,6 +1,7 @@
 import React, { use, useState } from 'react';
 import axios from 'axios';
 import { Analytics } from '@vercel/analytics/react';
+import { streamAdvice, previewFromTokens, STAGE_LABELS } from './streamAdvice';
 
 const API_URL = "https://anna-data-452522242685.europe-west1.run.app";
 
@@ -15,18 +16,35 @@ function MockupSMS() {
   const [scheduledRunResult, setScheduledRunResult] = useState(null);
   const [loadingScheduled, setLoadingScheduled] = useState(false);
 
+  // updates the last conversation entry (the one being streamed)
+  const updateLast = (update) => {
+    setResponses(prev => [...prev.slice(0, -1), { ...prev[prev.length - 1], ...update(prev[prev.length - 1]) }]);
+  };
+
   const handleSend = async (e) => {
     setLoadingMessages(true);
     e.preventDefault();
     setError(null);
+    setResponses(prev => [
+      ...prev,
+      { phone, message, response: null, partial: '', stage: 'Sending...' }
+    ]);
+    setMessage('');
     try {
-      const res = await axios.post(`${API_URL}/mockup-webhook`, { phone, message });
-      setResponses(prev => [
-        ...prev,
-        { phone, message, response: res.data }
-      ]);
-      setMessage('');
+      // advice is rendered as the stream comes in instead of after the whole pipeline
+      await streamAdvice(`${API_URL}/mockup-webhook-stream`, { phone, message }, (event, data) => {
+        if (event === 'stage') {
+          updateLast(() => ({ stage: STAGE_LABELS[data.stage] || data.stage }));
+        } else if (event === 'token') {
+          updateLast(entry => ({ partial: entry.partial + data.text }));
+        } else if (event === 'advice') {
+          updateLast(() => ({ response: data, stage: null }));
+        } else if (event === 'error') {
+          throw new Error(data.error);
+        }
+      });
     } catch (err) {
+      setResponses(prev => prev.filter(entry => entry.response !== null));
       setError(err.message || 'Error sending message');
     }
     setLoadingMessages(false);
@@ -131,7 +149,14 @@ function MockupSMS() {
                     {/* {typeof entry.response === 'object'
                       ? JSON.stringify(entry.response.advice)
                       : String(entry.response)} */}
-                      {extractAdviceFromString(entry.response.advice)}
+                      {entry.response
+                        ? extractAdviceFromString(entry.response.advice)
+                        : (
+                          <span className="whitespace-pre-line">
+                            <span className="block text-xs text-gray-500 mb-1">{entry.stage}</span>
+                            {previewFromTokens(entry.partial)}
+                          </span>
+                        )}
                   </div>
                 </div>
               ))
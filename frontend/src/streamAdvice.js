@@ -0,0 +1,52 @@
+// Reads the server-sent events of /mockup-webhook-stream.
+// onEvent(event, data) is called for every "stage", "token", "advice" and "error" event.
+export async function streamAdvice(url, body, onEvent) {
+  const res = await fetch(url, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+    body: JSON.stringify(body),
+  });
+  if (!res.ok || !res.body) {
+    throw new Error(`Request failed with status ${res.status}`);
+  }
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    // events are separated by a blank line
+    let end;
+    while ((end = buffer.indexOf('\n\n')) !== -1) {
+      const block = buffer.slice(0, end);
+      buffer = buffer.slice(end + 2);
+      let event = 'message';
+      let data = '';
+      for (const line of block.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) data += line.slice(5).trim();
+      }
+      if (data) onEvent(event, JSON.parse(data));
+    }
+  }
+}
+
+// The advisory LLM answers in JSON, strip the syntax so partial tokens read as text
+export function previewFromTokens(text) {
+  return text
+    .replace(/\\n/g, '\n')
+    .replace(/"\s*,\s*"/g, '\n\n')
+    .replace(/"\s*:\s*"/g, ':\n')
+    .replace(/[{}"]/g, '');
+}
+
+export const STAGE_LABELS = {
+  db_operations: 'Updating your details...',
+  weather_api_node: 'Fetched weather forecast',
+  market_api_node: 'Fetched market prices',
+  advisory_node: 'Advice ready',
+  multilingual_output_node: 'Translating...',
+};